@@ -1,43 +1,1908 @@
-from flask import Flask, request, jsonify
+import base64
+import csv
+import functools
+import hashlib
+import json
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import date as Date, datetime, timedelta
+
+from flask import Flask, Response, request, jsonify, stream_with_context, url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import delete, event, func, insert, inspect, or_, select, tuple_, type_coerce, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+import ledger_format
+from money import to_cents
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///budget.db'
+app.config['MAX_PAGE_SIZE'] = 1000
+app.config['STREAM_BATCH_SIZE'] = 1000
+app.config['BATCH_CHUNK_SIZE'] = 50000
+app.config['IMPORT_CHUNK_SIZE'] = 10000
+app.config['IMPORT_MAX_LINE'] = 1 << 20
+app.config['CHANGE_LOG_RETENTION'] = 1000000
+app.config['MAINTENANCE_INTERVAL'] = 3600
+app.config['CHECKPOINT_INTERVAL'] = 300
+app.config['ANALYZE_INTERVAL'] = 3600
+app.config['WRITE_BEHIND'] = False
+app.config['WRITE_BEHIND_QUEUE_SIZE'] = 10000
+app.config['WRITE_BEHIND_BATCH_SIZE'] = 1000
+app.config['WRITE_BEHIND_LINGER_MS'] = 2
+app.config['WRITE_BEHIND_RETRY_AFTER'] = 1
+app.config['WRITE_BEHIND_TIMEOUT'] = 5
+app.config['REPORT_CACHE_SIZE'] = 1024
+app.config['COMPRESS_MIN_SIZE'] = 1024
+app.config['COMPRESS_LEVEL'] = 6
+# Endpoints that read transactions as plain column tuples instead of ORM
+# objects; remove one to put it back on the ORM path.
+app.config['FAST_READ_ENDPOINTS'] = ['get_transactions', 'get_changes']
+# Set to a file path to share cached reports between worker processes.
+app.config['REPORT_CACHE_PATH'] = None
+# Applied to every new SQLite connection, in order. Override single entries
+# with e.g. BUDGET_SQLITE_PRAGMAS__synchronous=full.
+app.config['SQLITE_PRAGMAS'] = {
+    'busy_timeout': 5000,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'temp_store': 'memory',
+    'foreign_keys': 'on',
+}
+app.config.from_prefixed_env('BUDGET')
 db = SQLAlchemy(app)
 
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+class Category(db.Model):
+    __tablename__ = 'categories'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name
+        }
+
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    trans_type = db.Column(db.String(50))
-    amount = db.Column(db.Float)
-    category = db.Column(db.String(50))
-    date = db.Column(db.String(50))
+    trans_type = db.Column(db.String(50), nullable=False)
+    amount_cents = db.Column(db.BigInteger, nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_transaction_date_id_amount', 'date', 'id', 'amount_cents'),
+        db.Index('ix_transaction_type_category_amount', 'trans_type', 'category_id', 'amount_cents'),
+        db.Index('ix_transaction_category_date', 'category_id', 'date'),
+        db.CheckConstraint("trans_type IN ('income', 'expense')", name='ck_transaction_trans_type'),
+    )
 
     def to_dict(self):
         return {
             'id': self.id,
             'trans_type': self.trans_type,
-            'amount': self.amount,
-            'category': self.category,
-            'date': self.date
+            'amount': from_cents(self.amount_cents),
+            'category': category_cache.name(self.category_id),
+            'date': self.date.isoformat()
+        }
+
+class Change(db.Model):
+    """One row per insert, update or delete (tombstone) on the ledger.
+
+    Versions only ever grow, so the newest one doubles as the data version
+    that ETags and the change feed are built on.
+    """
+    __tablename__ = 'changes'
+    version = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False)
+
+class ChangeLogState(db.Model):
+    """Single-row bookkeeping for the change log.
+
+    compacted is the newest version that compaction has thrown away; clients
+    that last synced before it have to start over.
+    """
+    __tablename__ = 'change_log_state'
+    id = db.Column(db.Integer, primary_key=True)
+    compacted = db.Column(db.BigInteger, nullable=False, default=0)
+
+class Totals(db.Model):
+    """Single-row running totals, so /status never has to scan the ledger."""
+    __tablename__ = 'totals'
+    id = db.Column(db.Integer, primary_key=True)
+    income_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    expense_cents = db.Column(db.BigInteger, nullable=False, default=0)
+
+class MonthlyRollup(db.Model):
+    """Per-month sums and counts of the ledger by category and type.
+
+    month is the first day of the month. Reports over whole months read
+    these few rows instead of the transactions themselves.
+    """
+    __tablename__ = 'monthly_rollup'
+    month = db.Column(db.Date, primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    trans_type = db.Column(db.String(50), primary_key=True)
+    total_cents = db.Column(db.BigInteger, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+
+class ImportJob(db.Model):
+    """A resumable streamed import into the ledger.
+
+    The committed_* counters advance in the same transaction as each chunk
+    of rows, so they always describe exactly what has been written: an
+    interrupted upload resumes at committed_bytes of its source.
+    """
+    __tablename__ = 'import_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    format = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    columns = db.Column(db.String)
+    committed_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    committed_lines = db.Column(db.Integer, nullable=False, default=0)
+    committed_rows = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'format': self.format,
+            'status': self.status,
+            'offset': self.committed_bytes,
+            'lines': self.committed_lines,
+            'rows': self.committed_rows,
+            'error': self.error
         }
 
+# Every write path -- ORM, Core bulk inserts or plain SQL -- goes through
+# these, so neither the change log nor the aggregates can fall behind the
+# ledger. Applied idempotently by init_db().
+LEDGER_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS transaction_log_insert AFTER INSERT ON "transaction" BEGIN
+        INSERT INTO changes (transaction_id, deleted) VALUES (NEW.id, 0);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS transaction_log_update AFTER UPDATE ON "transaction" BEGIN
+        INSERT INTO changes (transaction_id, deleted) VALUES (NEW.id, 0);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS transaction_log_delete AFTER DELETE ON "transaction" BEGIN
+        INSERT INTO changes (transaction_id, deleted) VALUES (OLD.id, 1);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS transaction_totals_insert AFTER INSERT ON "transaction" BEGIN
+        UPDATE totals SET
+            income_cents = income_cents + CASE NEW.trans_type WHEN 'income' THEN NEW.amount_cents ELSE 0 END,
+            expense_cents = expense_cents + CASE NEW.trans_type WHEN 'expense' THEN NEW.amount_cents ELSE 0 END
+        WHERE id = 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS transaction_totals_update AFTER UPDATE OF trans_type, amount_cents ON "transaction" BEGIN
+        UPDATE totals SET
+            income_cents = income_cents
+                - CASE OLD.trans_type WHEN 'income' THEN OLD.amount_cents ELSE 0 END
+                + CASE NEW.trans_type WHEN 'income' THEN NEW.amount_cents ELSE 0 END,
+            expense_cents = expense_cents
+                - CASE OLD.trans_type WHEN 'expense' THEN OLD.amount_cents ELSE 0 END
+                + CASE NEW.trans_type WHEN 'expense' THEN NEW.amount_cents ELSE 0 END
+        WHERE id = 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS transaction_totals_delete AFTER DELETE ON "transaction" BEGIN
+        UPDATE totals SET
+            income_cents = income_cents - CASE OLD.trans_type WHEN 'income' THEN OLD.amount_cents ELSE 0 END,
+            expense_cents = expense_cents - CASE OLD.trans_type WHEN 'expense' THEN OLD.amount_cents ELSE 0 END
+        WHERE id = 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS transaction_rollup_insert AFTER INSERT ON "transaction" BEGIN
+        INSERT INTO monthly_rollup (month, category_id, trans_type, total_cents, count)
+        VALUES (strftime('%Y-%m-01', NEW.date), NEW.category_id, NEW.trans_type, NEW.amount_cents, 1)
+        ON CONFLICT DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS transaction_rollup_update
+    AFTER UPDATE OF trans_type, amount_cents, category_id, date ON "transaction" BEGIN
+        UPDATE monthly_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+        WHERE month = strftime('%Y-%m-01', OLD.date) AND category_id = OLD.category_id AND trans_type = OLD.trans_type;
+        DELETE FROM monthly_rollup
+        WHERE month = strftime('%Y-%m-01', OLD.date) AND category_id = OLD.category_id AND trans_type = OLD.trans_type
+          AND count = 0;
+        INSERT INTO monthly_rollup (month, category_id, trans_type, total_cents, count)
+        VALUES (strftime('%Y-%m-01', NEW.date), NEW.category_id, NEW.trans_type, NEW.amount_cents, 1)
+        ON CONFLICT DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS transaction_rollup_delete AFTER DELETE ON "transaction" BEGIN
+        UPDATE monthly_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+        WHERE month = strftime('%Y-%m-01', OLD.date) AND category_id = OLD.category_id AND trans_type = OLD.trans_type;
+        DELETE FROM monthly_rollup
+        WHERE month = strftime('%Y-%m-01', OLD.date) AND category_id = OLD.category_id AND trans_type = OLD.trans_type
+          AND count = 0;
+    END
+    ''',
+]
+
+class CategoryCache:
+    """In-process name <-> id map over the categories table.
+
+    Categories are few and almost never change, so serializing a row or
+    resolving a posted name is a dict lookup; a miss re-reads the table in
+    case another process added the category.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        with db.engine.connect() as connection:
+            rows = connection.execute(select(Category.id, Category.name)).all()
+        with self._lock:
+            self._names = dict(rows)
+            self._ids = {name: category_id for category_id, name in rows}
+
+    def clear(self):
+        with self._lock:
+            self._ids = {}
+            self._names = {}
+
+    def name(self, category_id):
+        """Return a category's name, or None for a row whose category is gone."""
+        if category_id not in self._names:
+            self._refresh()
+        return self._names.get(category_id)
+
+    def id(self, name):
+        """Return the id of an existing category, or None."""
+        if name not in self._ids:
+            self._refresh()
+        return self._ids.get(name)
+
+    def resolve(self, names):
+        """Map each name to its id, registering any new categories.
+
+        New categories are committed on their own connection straight away, so
+        call this before the request starts writing. An unused category left
+        behind by a failed request is harmless.
+        """
+        missing = [name for name in names if name not in self._ids]
+        if missing:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    insert(Category).prefix_with('OR IGNORE'),
+                    [{'name': name} for name in missing]
+                )
+            self._refresh()
+        return {name: self._ids[name] for name in names}
+
+category_cache = CategoryCache()
+
+class MemoryReportStore:
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, value):
+        """Store a value; returns how many entries were evicted to make room."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        evicted = 0
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteReportStore:
+    """The same LRU contract, kept in a SQLite file several processes can share."""
+
+    def __init__(self, size, path):
+        self.size = size
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._connection.execute('PRAGMA busy_timeout = 5000')
+        self._connection.execute('PRAGMA journal_mode = wal')
+        self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS report_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                used REAL NOT NULL
+            )
+        ''')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS ix_report_cache_used ON report_cache (used)')
+
+    def get(self, key):
+        row = self._connection.execute('SELECT value FROM report_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self._connection.execute('UPDATE report_cache SET used = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        self._connection.execute(
+            'INSERT OR REPLACE INTO report_cache (key, value, used) VALUES (?, ?, ?)',
+            (key, json.dumps(value), time.time())
+        )
+        return self._connection.execute('''
+            DELETE FROM report_cache WHERE key IN (
+                SELECT key FROM report_cache ORDER BY used DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.size,)).rowcount
+
+    def clear(self):
+        self._connection.execute('DELETE FROM report_cache')
+
+    def __len__(self):
+        return self._connection.execute('SELECT count(*) FROM report_cache').fetchone()[0]
+
+class ReportCache:
+    """Size-bounded LRU cache for report results.
+
+    Keys carry the data version, so a write makes every older entry
+    unreachable without touching the cache; those entries simply age out.
+    Backed by REPORT_CACHE_PATH when set, otherwise held in process.
+    """
+
+    def __init__(self):
+        self._store = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _get_store(self):
+        if self._store is None:
+            if app.config['REPORT_CACHE_PATH']:
+                self._store = SQLiteReportStore(app.config['REPORT_CACHE_SIZE'], app.config['REPORT_CACHE_PATH'])
+            else:
+                self._store = MemoryReportStore(app.config['REPORT_CACHE_SIZE'])
+        return self._store
+
+    def clear(self):
+        with self._lock:
+            if isinstance(self._store, SQLiteReportStore):
+                self._store.clear()
+            self._store = None
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._get_store()),
+                'size': app.config['REPORT_CACHE_SIZE'],
+                'shared': bool(app.config['REPORT_CACHE_PATH'])
+            }
+
+    def memoize(self, func):
+        """Cache a report function; its arguments must already be normalized."""
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = json.dumps([func.__name__, current_data_version(), *args], default=str)
+            with self._lock:
+                value = self._get_store().get(key)
+                if value is not None:
+                    self.hits += 1
+                    return value
+                self.misses += 1
+            value = func(*args)
+            with self._lock:
+                self.evictions += self._get_store().put(key, value)
+            return value
+        return wrapper
+
+report_cache = ReportCache()
+
+# Schema migrations, applied in order to databases created by an older
+# version of the app. PRAGMA user_version records how many have run. Each
+# migration is frozen SQL rather than derived from the models, since the
+# models only describe the latest schema.
+
+def add_transaction_indexes(connection):
+    connection.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_transaction_date_id ON "transaction" (date, id)')
+    connection.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_transaction_type_category_amount ON "transaction" (trans_type, category, amount)')
+    connection.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_transaction_category_date ON "transaction" (category, date)')
+
+def store_amounts_as_cents(connection):
+    # The first version accepted "amount": null; there is no amount to carry
+    # forward for those rows, and every total downstream needs one.
+    missing = [row[0] for row in connection.exec_driver_sql(
+        'SELECT id FROM "transaction" WHERE amount IS NULL ORDER BY id LIMIT 20'
+    )]
+    if missing:
+        raise RuntimeError(
+            'Transactions ' + ', '.join(map(str, missing)) + ' have no amount; '
+            'fix them by hand and restart.'
+        )
+    # ALTER TABLE can't change a column's type, and the old amount column
+    # was declared FLOAT, so the cents go into a new BIGINT column instead.
+    connection.exec_driver_sql('''
+        CREATE TABLE transaction_new (
+            id INTEGER NOT NULL,
+            trans_type VARCHAR(50),
+            amount_cents BIGINT NOT NULL,
+            category VARCHAR(50),
+            date VARCHAR(50),
+            PRIMARY KEY (id)
+        )
+    ''')
+    connection.exec_driver_sql('''
+        INSERT INTO transaction_new (id, trans_type, amount_cents, category, date)
+        SELECT id, trans_type, CAST(ROUND(amount * 100) AS INTEGER), category, date
+        FROM "transaction"
+    ''')
+    connection.exec_driver_sql('DROP TABLE "transaction"')
+    connection.exec_driver_sql('ALTER TABLE transaction_new RENAME TO "transaction"')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_date_id ON "transaction" (date, id)')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_type_category_amount ON "transaction" (trans_type, category, amount_cents)')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_category_date ON "transaction" (category, date)')
+
+LEGACY_DATE_FORMATS = ('%Y/%m/%d', '%m/%d/%Y', '%d.%m.%Y')
+
+def parse_legacy_date(value):
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        pass
+    for date_format in LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f'Unrecognised date {value!r}')
+
+def store_dates_as_iso_dates(connection):
+    # date() round-trips only well-formed, real YYYY-MM-DD dates unchanged.
+    rows = connection.exec_driver_sql(
+        'SELECT id, date FROM "transaction" WHERE date IS NULL OR date(date) IS NOT date'
+    ).all()
+    for transaction_id, value in rows:
+        try:
+            normalized = parse_legacy_date(value).isoformat()
+        except (TypeError, ValueError):
+            raise RuntimeError(
+                f'Transaction {transaction_id} has an unrecognised date {value!r}; '
+                'fix it by hand and restart.'
+            )
+        connection.exec_driver_sql('UPDATE "transaction" SET date = ? WHERE id = ?', (normalized, transaction_id))
+    connection.exec_driver_sql('''
+        CREATE TABLE transaction_new (
+            id INTEGER NOT NULL,
+            trans_type VARCHAR(50),
+            amount_cents BIGINT NOT NULL,
+            category VARCHAR(50),
+            date DATE NOT NULL,
+            PRIMARY KEY (id)
+        )
+    ''')
+    connection.exec_driver_sql('''
+        INSERT INTO transaction_new (id, trans_type, amount_cents, category, date)
+        SELECT id, trans_type, amount_cents, category, date FROM "transaction"
+    ''')
+    connection.exec_driver_sql('DROP TABLE "transaction"')
+    connection.exec_driver_sql('ALTER TABLE transaction_new RENAME TO "transaction"')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_date_id ON "transaction" (date, id)')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_type_category_amount ON "transaction" (trans_type, category, amount_cents)')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_category_date ON "transaction" (category, date)')
+
+def add_categories_table(connection):
+    connection.exec_driver_sql('''
+        CREATE TABLE categories (
+            id INTEGER NOT NULL,
+            name VARCHAR(50) NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE (name)
+        )
+    ''')
+    connection.exec_driver_sql('''
+        INSERT INTO categories (name)
+        SELECT DISTINCT COALESCE(category, 'Uncategorized') FROM "transaction" ORDER BY 1
+    ''')
+    connection.exec_driver_sql('''
+        CREATE TABLE transaction_new (
+            id INTEGER NOT NULL,
+            trans_type VARCHAR(50),
+            amount_cents BIGINT NOT NULL,
+            category_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(category_id) REFERENCES categories (id)
+        )
+    ''')
+    connection.exec_driver_sql('''
+        INSERT INTO transaction_new (id, trans_type, amount_cents, category_id, date)
+        SELECT t.id, t.trans_type, t.amount_cents, c.id, t.date
+        FROM "transaction" t JOIN categories c ON c.name = COALESCE(t.category, 'Uncategorized')
+    ''')
+    connection.exec_driver_sql('DROP TABLE "transaction"')
+    connection.exec_driver_sql('ALTER TABLE transaction_new RENAME TO "transaction"')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_date_id ON "transaction" (date, id)')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_type_category_amount ON "transaction" (trans_type, category_id, amount_cents)')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_category_date ON "transaction" (category_id, date)')
+
+def add_change_log(connection):
+    # The change log takes over from the data_version counter; carry its
+    # value forward so versions (and so ETags) never go backwards.
+    version = 0
+    if inspect(connection).has_table('data_version'):
+        version = connection.exec_driver_sql('SELECT version FROM data_version WHERE id = 1').scalar() or 0
+        connection.exec_driver_sql('DROP TABLE data_version')
+    connection.exec_driver_sql('''
+        CREATE TABLE change_log_state (
+            id INTEGER NOT NULL,
+            compacted BIGINT NOT NULL,
+            PRIMARY KEY (id)
+        )
+    ''')
+    connection.exec_driver_sql('''
+        CREATE TABLE changes (
+            version INTEGER NOT NULL,
+            transaction_id INTEGER NOT NULL,
+            deleted BOOLEAN NOT NULL,
+            PRIMARY KEY (version)
+        )
+    ''')
+    # Seed the log with every existing row so a client can sync from zero.
+    seeded = connection.exec_driver_sql('''
+        INSERT INTO changes (version, transaction_id, deleted)
+        SELECT ? + ROW_NUMBER() OVER (ORDER BY id), id, 0 FROM "transaction"
+    ''', (version,)).rowcount
+    if version and not seeded:
+        # An emptied ledger still needs an entry holding the old version.
+        connection.exec_driver_sql('INSERT INTO changes (version, transaction_id, deleted) VALUES (?, 0, 1)', (version,))
+
+def add_totals_table(connection):
+    connection.exec_driver_sql('''
+        CREATE TABLE totals (
+            id INTEGER NOT NULL,
+            income_cents BIGINT NOT NULL,
+            expense_cents BIGINT NOT NULL,
+            PRIMARY KEY (id)
+        )
+    ''')
+    connection.exec_driver_sql('''
+        INSERT INTO totals (id, income_cents, expense_cents)
+        SELECT 1,
+               coalesce(sum(CASE trans_type WHEN 'income' THEN amount_cents END), 0),
+               coalesce(sum(CASE trans_type WHEN 'expense' THEN amount_cents END), 0)
+        FROM "transaction"
+    ''')
+
+def add_monthly_rollup(connection):
+    connection.exec_driver_sql('''
+        CREATE TABLE monthly_rollup (
+            month DATE NOT NULL,
+            category_id INTEGER NOT NULL,
+            trans_type VARCHAR(50) NOT NULL,
+            total_cents BIGINT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (month, category_id, trans_type),
+            FOREIGN KEY(category_id) REFERENCES categories (id)
+        )
+    ''')
+    connection.exec_driver_sql('''
+        INSERT INTO monthly_rollup (month, category_id, trans_type, total_cents, count)
+        SELECT strftime('%Y-%m-01', date), category_id, trans_type, sum(amount_cents), count(*)
+        FROM "transaction"
+        GROUP BY 1, 2, 3
+    ''')
+
+def cover_amounts_in_date_index(connection):
+    # Date-range reads of just date and amount (charts) become index-only.
+    connection.exec_driver_sql('DROP INDEX IF EXISTS ix_transaction_date_id')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_date_id_amount ON "transaction" (date, id, amount_cents)')
+
+def check_transaction_types(connection):
+    # The first version stored trans_type as sent, so 'Expense' rows were
+    # left out of totals and broke the binary export. Normalize the case,
+    # refuse to guess at anything else, and let a CHECK keep it that way.
+    unknown = [row[0] for row in connection.exec_driver_sql('''
+        SELECT id FROM "transaction"
+        WHERE trans_type IS NULL OR lower(trim(trans_type)) NOT IN ('income', 'expense')
+        ORDER BY id LIMIT 20
+    ''')]
+    if unknown:
+        raise RuntimeError(
+            'Transactions ' + ', '.join(map(str, unknown)) + ' have a trans_type other than income or expense; '
+            'fix them and restart'
+        )
+    connection.exec_driver_sql('''
+        INSERT INTO changes (transaction_id, deleted)
+        SELECT id, 0 FROM "transaction" WHERE trans_type != lower(trim(trans_type)) ORDER BY id
+    ''')
+    connection.exec_driver_sql('''
+        CREATE TABLE transaction_new (
+            id INTEGER NOT NULL,
+            trans_type VARCHAR(50) NOT NULL,
+            amount_cents BIGINT NOT NULL,
+            category_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(category_id) REFERENCES categories (id),
+            CONSTRAINT ck_transaction_trans_type CHECK (trans_type IN ('income', 'expense'))
+        )
+    ''')
+    connection.exec_driver_sql('''
+        INSERT INTO transaction_new (id, trans_type, amount_cents, category_id, date)
+        SELECT id, lower(trim(trans_type)), amount_cents, category_id, date FROM "transaction"
+    ''')
+    connection.exec_driver_sql('DROP TABLE "transaction"')
+    connection.exec_driver_sql('ALTER TABLE transaction_new RENAME TO "transaction"')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_date_id_amount ON "transaction" (date, id, amount_cents)')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_type_category_amount ON "transaction" (trans_type, category_id, amount_cents)')
+    connection.exec_driver_sql('CREATE INDEX ix_transaction_category_date ON "transaction" (category_id, date)')
+    # Both aggregates were built while the mixed-case rows didn't match.
+    connection.exec_driver_sql('''
+        UPDATE totals SET
+            income_cents = (SELECT coalesce(sum(amount_cents), 0) FROM "transaction" WHERE trans_type = 'income'),
+            expense_cents = (SELECT coalesce(sum(amount_cents), 0) FROM "transaction" WHERE trans_type = 'expense')
+    ''')
+    connection.exec_driver_sql('DELETE FROM monthly_rollup')
+    connection.exec_driver_sql('''
+        INSERT INTO monthly_rollup (month, category_id, trans_type, total_cents, count)
+        SELECT strftime('%Y-%m-01', date), category_id, trans_type, sum(amount_cents), count(*)
+        FROM "transaction"
+        GROUP BY 1, 2, 3
+    ''')
+
+MIGRATIONS = [
+    add_transaction_indexes,
+    store_amounts_as_cents,
+    store_dates_as_iso_dates,
+    add_categories_table,
+    add_change_log,
+    add_totals_table,
+    add_monthly_rollup,
+    cover_amounts_in_date_index,
+    check_transaction_types,
+]
+
+def init_db():
+    """Create a fresh database, or migrate an existing one to the current schema."""
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        migrated = False
+        if inspect(connection).has_table(Transaction.__tablename__):
+            version = connection.exec_driver_sql('PRAGMA user_version').scalar()
+            for migration in MIGRATIONS[version:]:
+                migration(connection)
+                migrated = True
+        db.metadata.create_all(connection)
+        connection.exec_driver_sql(f'PRAGMA user_version = {len(MIGRATIONS)}')
+        connection.exec_driver_sql('INSERT OR IGNORE INTO change_log_state (id, compacted) VALUES (1, 0)')
+        connection.exec_driver_sql('INSERT OR IGNORE INTO totals (id, income_cents, expense_cents) VALUES (1, 0, 0)')
+        for trigger in LEDGER_TRIGGERS:
+            connection.exec_driver_sql(trigger)
+        # Whatever was importing when the server last stopped can be resumed.
+        connection.exec_driver_sql("UPDATE import_jobs SET status = 'interrupted' WHERE status = 'running'")
+    category_cache.clear()
+    report_cache.clear()
+    if migrated:
+        # Refresh planner statistics so the new indexes actually get picked.
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
+
+def compact_changes():
+    """Shrink the change log.
+
+    Only the newest entry per transaction matters to a syncing client, so
+    older ones are always dropped. Tombstones more than CHANGE_LOG_RETENTION
+    versions old are expired too, which moves the compaction horizon.
+    """
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        superseded = connection.exec_driver_sql('''
+            DELETE FROM changes
+            WHERE version NOT IN (SELECT max(version) FROM changes GROUP BY transaction_id)
+        ''').rowcount
+        # The newest entry is never removed: it holds the current version.
+        version = connection.exec_driver_sql('SELECT max(version) FROM changes').scalar() or 0
+        horizon = min(version - app.config['CHANGE_LOG_RETENTION'], version - 1)
+        expired = connection.exec_driver_sql(
+            'SELECT max(version) FROM changes WHERE deleted AND version <= ?', (horizon,)
+        ).scalar()
+        if expired is not None:
+            connection.exec_driver_sql('DELETE FROM changes WHERE deleted AND version <= ?', (expired,))
+            connection.exec_driver_sql('UPDATE change_log_state SET compacted = ? WHERE id = 1', (expired,))
+    return superseded
+
+def checkpoint_wal():
+    """Copy the write-ahead log back into the database and truncate it."""
+    with db.engine.connect() as connection:
+        return connection.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').one()
+
+def analyze_ledger():
+    """Refresh planner statistics from a bounded sample of each index.
+
+    Without them SQLite can't tell that trans_type has only two values, and
+    drives filtered pages from that index plus a sort instead of walking the
+    date index.
+    """
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('PRAGMA analysis_limit = 1000')
+        connection.exec_driver_sql('ANALYZE')
+
+# (task, config key holding its interval in seconds)
+MAINTENANCE_TASKS = [
+    (compact_changes, 'MAINTENANCE_INTERVAL'),
+    (checkpoint_wal, 'CHECKPOINT_INTERVAL'),
+    (analyze_ledger, 'ANALYZE_INTERVAL'),
+]
+
+def run_maintenance():
+    due = {task: time.monotonic() + app.config[key] for task, key in MAINTENANCE_TASKS}
+    intervals = dict(MAINTENANCE_TASKS)
+    while True:
+        task = min(due, key=due.get)
+        time.sleep(max(0, due[task] - time.monotonic()))
+        with app.app_context():
+            try:
+                task()
+            except Exception:
+                app.logger.exception('Maintenance task %s failed', task.__name__)
+        due[task] = time.monotonic() + app.config[intervals[task]]
+
+def start_maintenance():
+    """Run periodic housekeeping on a daemon thread."""
+    thread = threading.Thread(target=run_maintenance, name='maintenance', daemon=True)
+    thread.start()
+    return thread
+
+class WriteBehindQueue:
+    """Group commit for POST /transactions.
+
+    Requests put their validated row on a bounded queue and wait; a single
+    writer thread drains it, inserting up to WRITE_BEHIND_BATCH_SIZE rows --
+    or whatever arrived within WRITE_BEHIND_LINGER_MS -- per transaction, and
+    releases each request only once its batch has committed.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def submit(self, values):
+        """Queue a row; returns a Future for its id. Raises queue.Full when saturated."""
+        with self._lock:
+            if self._queue is None:
+                self._queue = queue.Queue(app.config['WRITE_BEHIND_QUEUE_SIZE'])
+                threading.Thread(target=self._run, name='write-behind', daemon=True).start()
+        future = Future()
+        self._queue.put_nowait((values, future))
+        return future
+
+    def _next_batch(self, batch):
+        # Fills `batch` in place, so whatever was taken off the queue can
+        # still be failed if something goes wrong part way.
+        deadline = None
+        while len(batch) < app.config['WRITE_BEHIND_BATCH_SIZE']:
+            try:
+                if deadline is None:
+                    item = self._queue.get()
+                    deadline = time.monotonic() + app.config['WRITE_BEHIND_LINGER_MS'] / 1000
+                else:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            # A request that gave up waiting has cancelled its row; skip it.
+            if item[1].set_running_or_notify_cancel():
+                batch.append(item)
+
+    def _run(self):
+        with app.app_context(), db.engine.connect() as connection:
+            # An acknowledged write has to survive a power cut, so this
+            # connection fsyncs every commit; batching is what makes that cheap.
+            connection.exec_driver_sql('PRAGMA synchronous = full')
+            connection.commit()
+            while True:
+                batch = []
+                try:
+                    self._next_batch(batch)
+                    if not batch:
+                        continue
+                    with connection.begin():
+                        connection.exec_driver_sql('BEGIN IMMEDIATE')
+                        connection.execute(insert(Transaction.__table__), [values for values, _ in batch])
+                        # Same contiguous-rowid reasoning as the batch endpoint.
+                        last_id = connection.scalar(select(func.max(Transaction.id)))
+                    for offset, (_, future) in enumerate(batch):
+                        future.set_result(last_id - len(batch) + 1 + offset)
+                except Exception as e:
+                    # Only this batch fails; the thread carries on with the next.
+                    app.logger.exception('Write-behind batch failed')
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+
+write_behind = WriteBehindQueue()
+
+@app.cli.command('compact-changes')
+def compact_changes_command():
+    """Compact the change log now."""
+    init_db()
+    print(f'Dropped {compact_changes()} superseded change(s).')
+
+def rebuild_totals():
+    """Recompute the running totals from the ledger.
+
+    Returns the drift that was corrected, as stored minus actual cents per
+    column; all zeros means the triggers had kept up.
+    """
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        income, expense = connection.exec_driver_sql('''
+            SELECT coalesce(sum(CASE trans_type WHEN 'income' THEN amount_cents END), 0),
+                   coalesce(sum(CASE trans_type WHEN 'expense' THEN amount_cents END), 0)
+            FROM "transaction"
+        ''').one()
+        stored = connection.execute(select(Totals.income_cents, Totals.expense_cents).where(Totals.id == 1)).one()
+        connection.exec_driver_sql(
+            'UPDATE totals SET income_cents = ?, expense_cents = ? WHERE id = 1', (income, expense)
+        )
+    # Rebuilding doesn't advance the data version, so cached statuses may be wrong.
+    report_cache.clear()
+    return {'income_cents': stored.income_cents - income, 'expense_cents': stored.expense_cents - expense}
+
+@app.cli.command('check-totals')
+def check_totals_command():
+    """Rebuild the running totals and report any drift."""
+    init_db()
+    drift = rebuild_totals()
+    if any(drift.values()):
+        print('Totals had drifted and were rebuilt: ' + ', '.join(f'{k} {v:+d}' for k, v in drift.items()))
+    else:
+        print('Totals are consistent.')
+
+def is_row_id(value):
+    # SQLite rowids are signed 64-bit; a bigger int can't be bound at all.
+    return isinstance(value, int) and not isinstance(value, bool) and -2 ** 63 <= value < 2 ** 63
+
+def encode_cursor(transaction):
+    # str() of a date is its ISO form, and fast-path rows already hold one.
+    raw = json.dumps([str(transaction.date), transaction.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor):
+    try:
+        date, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(date, str) or not is_row_id(transaction_id):
+        raise ValueError('Invalid cursor')
+    return Date.fromisoformat(date), transaction_id
+
+def parse_limit(value):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, app.config['MAX_PAGE_SIZE'])
+
+NDJSON = 'application/x-ndjson'
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+# Content-Encoding -> zlib wbits for that container format.
+ENCODINGS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+def negotiated_encoding():
+    return request.accept_encodings.best_match(list(ENCODINGS))
+
+def compress_chunks(chunks, encoding):
+    compressor = zlib.compressobj(app.config['COMPRESS_LEVEL'], zlib.DEFLATED, ENCODINGS[encoding])
+    for chunk in chunks:
+        # Sync-flush each chunk so a streaming client still sees rows as
+        # soon as they are produced.
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+@app.after_request
+def compress_response(response):
+    """gzip or deflate responses for clients that accept it.
+
+    Streamed bodies are compressed chunk by chunk as they go out; buffered
+    ones only once they reach COMPRESS_MIN_SIZE bytes.
+    """
+    encoding = negotiated_encoding()
+    if (encoding is None or response.status_code != 200 or request.method == 'HEAD'
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.is_streamed:
+        response.response = compress_chunks(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(b''.join(compress_chunks([data], encoding)))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# The fast read path selects these instead of the entity. The date is read
+# as the ISO string SQLite stores rather than parsed and formatted back.
+FIELD_COLUMNS = {
+    'id': Transaction.id,
+    'trans_type': Transaction.trans_type,
+    'amount': Transaction.amount_cents,
+    'category': Transaction.category_id,
+    'date': type_coerce(Transaction.date, db.String).label('date'),
+}
+ROW_COLUMNS = tuple(FIELD_COLUMNS.values())
+
+def parse_fields(value):
+    fields = tuple(dict.fromkeys(value.split(',')))
+    if not all(field in FIELD_COLUMNS for field in fields):
+        raise ValueError('fields must be a comma-separated list of: ' + ', '.join(FIELD_COLUMNS))
+    return fields
+
+def rows_to_dicts(rows):
+    """Transaction.to_dict() for ROW_COLUMNS tuples."""
+    name = category_cache.name
+    return [
+        {'id': id, 'trans_type': trans_type, 'amount': from_cents(cents), 'category': name(category_id), 'date': date}
+        for id, trans_type, cents, category_id, date in rows
+    ]
+
+def projected_dicts(fields):
+    """rows_to_dicts for rows whose leading columns are FIELD_COLUMNS[fields]."""
+    converters = {'amount': from_cents, 'category': category_cache.name}
+    columns = [(field, converters.get(field)) for field in fields]
+    def to_dicts(rows):
+        return [
+            {field: value if convert is None else convert(value) for (field, convert), value in zip(columns, row)}
+            for row in rows
+        ]
+    return to_dicts
+
+def models_to_dicts(transactions):
+    return [t.to_dict() for t in transactions]
+
+def execute_transactions(statement, fields=None, extra=(), **options):
+    """Run a select(Transaction) the way the current endpoint is configured to.
+
+    Returns the result and the function that serializes its rows. On the
+    fast path rows are plain tuples: no ORM hydration or identity map.
+    With `fields` only those columns are selected, followed by any `extra`
+    ones the caller needs (such as a cursor's) but the output omits.
+    """
+    if fields is not None:
+        extra = [field for field in extra if field not in fields]
+        statement = statement.with_only_columns(*(FIELD_COLUMNS[field] for field in (*fields, *extra)))
+        return db.session.execute(statement.execution_options(**options)), projected_dicts(fields)
+    if request.endpoint in app.config['FAST_READ_ENDPOINTS']:
+        statement = statement.with_only_columns(*ROW_COLUMNS)
+        return db.session.execute(statement.execution_options(**options)), rows_to_dicts
+    return db.session.execute(statement.execution_options(**options)).scalars(), models_to_dicts
+
+LAYOUTS = ('rows', 'columnar')
+
+def to_columnar(transactions, fields=tuple(FIELD_COLUMNS)):
+    """One array per field instead of one object per transaction.
+
+    Categories repeat heavily, so that column is dictionary-encoded: each
+    row carries an index into a list of the distinct names.
+    """
+    columns = {field: [t[field] for t in transactions] for field in fields}
+    if 'category' in columns:
+        dictionary = {}
+        codes = [dictionary.setdefault(name, len(dictionary)) for name in columns['category']]
+        columns['category'] = {'dictionary': list(dictionary), 'codes': codes}
+    return columns
+
+def stream_transactions(statement, fields=None):
+    # Rows come off a server-side cursor in yield_per batches, and each batch
+    # is written out as soon as it is serialized, so memory stays flat no
+    # matter how large the ledger is.
+    def generate():
+        result, to_dicts = execute_transactions(statement, fields, yield_per=app.config['STREAM_BATCH_SIZE'])
+        for batch in result.partitions():
+            yield ''.join(json.dumps(t) + '\n' for t in to_dicts(batch))
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+def parse_date_range(args):
+    start = parse_date(args['from']) if 'from' in args else None
+    end = parse_date(args['to']) if 'to' in args else None
+    return start, end
+
+def filter_by_date(statement, start, end):
+    # Both bounds are inclusive and resolve to a range scan on the date index.
+    if start is not None:
+        statement = statement.where(Transaction.date >= start)
+    if end is not None:
+        statement = statement.where(Transaction.date <= end)
+    return statement
+
+def month_start(day):
+    return day.replace(day=1)
+
+def next_month(day):
+    # None for December 9999: parse_date accepts it, but no month follows.
+    if (day.year, day.month) == (Date.max.year, Date.max.month):
+        return None
+    return (month_start(day) + timedelta(days=32)).replace(day=1)
+
+# measure -> (aggregate over the ledger, aggregate over the monthly rollup)
+MEASURES = {
+    'amount': (func.sum(Transaction.amount_cents), func.sum(MonthlyRollup.total_cents)),
+    'count': (func.count(), func.sum(MonthlyRollup.count)),
+}
+
+def sum_by(column, start, end, trans_type=None, measure='amount'):
+    """Sum amount_cents (or count rows) per `column` over the inclusive range [start, end].
+
+    Whole months come from the monthly rollup; only the days of a partially
+    covered first or last month are summed from the ledger itself.
+    """
+    in_ledger, in_rollup = MEASURES[measure]
+
+    def ledger(first, last):
+        # trans_type is grouped on rather than filtered, so the date index
+        # always drives the scan.
+        return filter_by_date(
+            select(getattr(Transaction, column), Transaction.trans_type, in_ledger), first, last
+        ).group_by(getattr(Transaction, column), Transaction.trans_type)
+
+    # Whole months form the half-open range [low, high); None is unbounded.
+    low = start if start is None or start.day == 1 else next_month(start)
+    high = end
+    if end == Date.max:
+        high = None
+    elif end is not None:
+        following = end + timedelta(days=1)
+        high = following if following.day == 1 else month_start(end)
+    if start is not None and low is None or low is not None and high is not None and low >= high:
+        statements = [ledger(start, end)]
+    else:
+        rollup = select(
+            getattr(MonthlyRollup, column), MonthlyRollup.trans_type, in_rollup
+        ).group_by(getattr(MonthlyRollup, column), MonthlyRollup.trans_type)
+        statements = []
+        if low is not None:
+            rollup = rollup.where(MonthlyRollup.month >= low)
+            if start < low:
+                statements.append(ledger(start, low - timedelta(days=1)))
+        if high is not None:
+            rollup = rollup.where(MonthlyRollup.month < high)
+            if high <= end:
+                statements.append(ledger(high, end))
+        statements.append(rollup)
+    totals = {}
+    for statement in statements:
+        for key, row_type, total in db.session.execute(statement):
+            if trans_type is None or row_type == trans_type:
+                totals[key] = totals.get(key, 0) + total
+    return totals
+
+def parse_amount(name, value):
+    try:
+        return to_cents(value)
+    except (ArithmeticError, ValueError):
+        raise ValueError(f'{name} must be an amount with at most two decimal places')
+
+def parse_filters(args):
+    """Normalize the type, category, from/to and min/max filters in `args`.
+
+    Returns (trans_type, category_ids, start, end, min_cents, max_cents),
+    with None for an absent filter. category may be repeated; names that
+    were never used match nothing.
+    """
+    start, end = parse_date_range(args)
+    trans_type = args.get('type')
+    if trans_type is not None and trans_type not in TRANSACTION_TYPES:
+        raise ValueError('type must be one of: ' + ', '.join(TRANSACTION_TYPES))
+    category_ids = None
+    if 'category' in args:
+        category_ids = sorted({category_cache.id(name) for name in args.getlist('category')} - {None})
+    min_cents = parse_amount('min', args['min']) if 'min' in args else None
+    max_cents = parse_amount('max', args['max']) if 'max' in args else None
+    return trans_type, category_ids, start, end, min_cents, max_cents
+
+def filter_transactions(statement, filters):
+    # Every bound is inclusive and becomes a bound parameter.
+    trans_type, category_ids, start, end, min_cents, max_cents = filters
+    statement = filter_by_date(statement, start, end)
+    if trans_type is not None:
+        statement = statement.where(Transaction.trans_type == trans_type)
+    if category_ids is not None:
+        statement = statement.where(Transaction.category_id.in_(category_ids))
+    if min_cents is not None:
+        statement = statement.where(Transaction.amount_cents >= min_cents)
+    if max_cents is not None:
+        statement = statement.where(Transaction.amount_cents <= max_cents)
+    return statement
+
+# Only orders an index can deliver -- the (date, id) index or the rowid,
+# read forwards or backwards -- so a sorted page never needs a filesort
+# over the whole ledger. Anything else is rejected.
+SORT_KEYS = {
+    'date': (Transaction.date, Transaction.id),
+    'id': (Transaction.id,),
+}
+SORTS = [*SORT_KEYS, *('-' + key for key in SORT_KEYS)]
+
+def parse_sort(value):
+    if value not in SORTS:
+        raise ValueError('sort must be one of: ' + ', '.join(SORTS))
+    return SORT_KEYS[value.lstrip('-')], value.startswith('-')
+
+def apply_sort(statement, sort):
+    columns, descending = sort
+    return statement.order_by(*(column.desc() if descending else column for column in columns))
+
+def seek(statement, sort, cursor):
+    """Keyset condition for the rows after `cursor` in `sort` order."""
+    columns, descending = sort
+    date, transaction_id = decode_cursor(cursor)
+    if len(columns) > 1:
+        key, value = tuple_(*columns), (date, transaction_id)
+    else:
+        key, value = columns[0], transaction_id
+    return statement.where(key < value if descending else key > value)
+
+def current_data_version():
+    # max() over the rowid is a single seek to the end of the b-tree.
+    return db.session.scalar(select(func.max(Change.version))) or 0
+
+def conditional(view, version=current_data_version):
+    """Tag a GET endpoint's response with a strong ETag built from the data
+    version, and answer a matching If-None-Match with 304 before the view
+    touches the ledger at all."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        variant = 'ndjson' if wants_ndjson() else 'json'
+        # Each content coding is a different representation, so it gets its
+        # own strong ETag.
+        encoding = negotiated_encoding()
+        if encoding is not None:
+            variant += '-' + encoding
+        etag = f'{version()}-{variant}'
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.vary.update(['Accept', 'Accept-Encoding'])
+        return response
+    return wrapper
+
 @app.route('/transactions', methods=['GET'])
+@conditional
 def get_transactions():
-    transactions = Transaction.query.all()
-    return jsonify([t.to_dict() for t in transactions])
+    try:
+        filters = parse_filters(request.args)
+        sort = parse_sort(request.args['sort']) if 'sort' in request.args else None
+        fields = parse_fields(request.args['fields']) if 'fields' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    layout = request.args.get('layout', 'rows')
+    if layout not in LAYOUTS:
+        return jsonify({'error': 'layout must be one of: ' + ', '.join(LAYOUTS)}), 400
+
+    if request.method == 'HEAD':
+        # Just the size: paging UIs use it without downloading anything.
+        return Response(headers={'X-Total-Count': count_transactions(*filters)}, mimetype='application/json')
+
+    statement = filter_transactions(select(Transaction), filters)
+    if wants_ndjson():
+        if layout != 'rows':
+            return jsonify({'error': 'NDJSON is always row-oriented'}), 400
+        if 'limit' in request.args or 'after' in request.args:
+            # A stream has nowhere to put the next cursor, so it isn't paged.
+            return jsonify({'error': 'NDJSON streams every match; limit and after are for JSON pages'}), 400
+        return stream_transactions(apply_sort(statement, sort or parse_sort('id')), fields)
+
+    shape = list
+    if layout == 'columnar':
+        shape = functools.partial(to_columnar, fields=fields or tuple(FIELD_COLUMNS))
+    if 'limit' not in request.args and 'after' not in request.args:
+        if sort is not None:
+            statement = apply_sort(statement, sort)
+        result, to_dicts = execute_transactions(statement, fields)
+        return jsonify(shape(to_dicts(result.all())))
+
+    # Keyset pagination: seek past the sort key of the last row served
+    # instead of using OFFSET, so every page costs the same.
+    sort = sort or parse_sort('date')
+    try:
+        limit = parse_limit(request.args.get('limit', app.config['MAX_PAGE_SIZE']))
+        statement = apply_sort(statement, sort)
+        if 'after' in request.args:
+            statement = seek(statement, sort, request.args['after'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    result, to_dicts = execute_transactions(statement.limit(limit + 1), fields, extra=('id', 'date'))
+    page = result.all()
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return jsonify({
+        'transactions': shape(to_dicts(page[:limit])),
+        'next': next_cursor
+    })
+
+TRANSACTION_TYPES = ('income', 'expense')
+TRANSACTION_FIELDS = ('trans_type', 'amount', 'category', 'date')
+
+# Amounts are stored and summed as integer cents; the API speaks currency
+# units, so convert exactly at the edges with money.to_cents.
+def from_cents(cents):
+    return cents / 100
+
+def parse_date(value):
+    # fromisoformat is an order of magnitude faster than strptime, but also
+    # takes forms like 20240701; the round-trip check keeps only YYYY-MM-DD.
+    try:
+        parsed = Date.fromisoformat(value)
+    except (TypeError, ValueError):
+        parsed = None
+    if parsed is None or parsed.isoformat() != value:
+        raise ValueError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+    return parsed
+
+def parse_transaction(data):
+    if not isinstance(data, dict):
+        raise ValueError('Transaction must be an object')
+    missing = [field for field in TRANSACTION_FIELDS if field not in data]
+    if missing:
+        raise ValueError('Missing field(s): ' + ', '.join(missing))
+    return parse_values(data)
+
+def parse_values(data):
+    """Validate and convert whichever of TRANSACTION_FIELDS `data` holds."""
+    values = {}
+    if 'trans_type' in data:
+        if data['trans_type'] not in TRANSACTION_TYPES:
+            raise ValueError('trans_type must be one of: ' + ', '.join(TRANSACTION_TYPES))
+        values['trans_type'] = data['trans_type']
+    if 'amount' in data:
+        amount = data['amount']
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount <= 0:
+            raise ValueError('amount must be a positive number')
+        values['amount_cents'] = to_cents(amount)
+    if 'category' in data:
+        if not isinstance(data['category'], str) or not data['category']:
+            raise ValueError('category must be a non-empty string')
+        values['category'] = data['category']
+    if 'date' in data:
+        values['date'] = parse_date(data['date'])
+    return values
+
+def parse_changes(changes):
+    """Validate the `set` object of an update."""
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError('set must be an object with the fields to change')
+    if not set(changes) <= set(TRANSACTION_FIELDS):
+        raise ValueError('Only these fields can be set: ' + ', '.join(TRANSACTION_FIELDS))
+    return parse_values(changes)
+
+def with_category_ids(rows, write):
+    """Swap each parsed row's category name for its id, then run `write`.
+
+    The cache trusts its hits, so a category deleted since -- by this worker
+    or another one -- makes `write` fail the foreign key check. The cache is
+    then dropped and `write` retried once with freshly resolved ids.
+    """
+    names = [row.pop('category', None) for row in rows]
+    for attempt in range(2):
+        ids = category_cache.resolve({name for name in names if name is not None})
+        for row, name in zip(rows, names):
+            if name is not None:
+                row['category_id'] = ids[name]
+        try:
+            return write()
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                raise
+            category_cache.clear()
+
+def export_version():
+    # The export carries every category, used or not, and adding or deleting
+    # one doesn't touch the change log; fold the dictionary into the version.
+    names = db.session.scalars(select(Category.name).order_by(Category.id)).all()
+    digest = hashlib.blake2b(json.dumps(names).encode(), digest_size=8).hexdigest()
+    return f'{current_data_version()}.{digest}'
+
+@app.route('/export', methods=['GET'])
+@functools.partial(conditional, version=export_version)
+def export_ledger():
+    """Stream the whole ledger in the binary format of ledger_format.py."""
+    if request.args.get('format') != 'bin':
+        return jsonify({'error': 'format must be bin'}), 400
+    # The dictionary and the rows are read in one transaction, so a category
+    # added while the ledger streams out can't be missing from the dictionary.
+    connection = db.session.connection().connection
+    cursor = connection.cursor()
+    cursor.execute('BEGIN')
+    categories = cursor.execute('SELECT id, name FROM categories ORDER BY id').fetchall()
+    codes = {category_id: code for code, (category_id, _) in enumerate(categories)}
+    types = ' '.join(f"WHEN '{name}' THEN {code}" for code, name in enumerate(ledger_format.TRANSACTION_TYPES))
+
+    def blocks():
+        # Plain SQL on the driver cursor: SQLite turns dates into ordinals
+        # (julian day 1721425.5 is 0001-01-01, ordinal 1) and types into
+        # codes, so rows come back ready to pack with no per-row ORM work.
+        cursor.execute(f'''
+            SELECT id, CAST(julianday(date) - 1721424.5 AS INTEGER), amount_cents,
+                   CASE trans_type {types} END, category_id
+            FROM "transaction" ORDER BY id
+        ''')
+        try:
+            while batch := cursor.fetchmany(app.config['STREAM_BATCH_SIZE']):
+                yield [(id, ordinal, cents, trans_type, codes[category_id])
+                       for id, ordinal, cents, trans_type, category_id in batch]
+        finally:
+            cursor.close()
+            connection.rollback()
+
+    response = Response(
+        stream_with_context(ledger_format.encode([name for _, name in categories], blocks())),
+        mimetype='application/octet-stream'
+    )
+    response.headers['Content-Disposition'] = 'attachment; filename=ledger.bin'
+    return response
 
 @app.route('/transactions', methods=['POST'])
 def add_transaction():
+    try:
+        values = parse_transaction(request.json)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def write():
+        if app.config['WRITE_BEHIND']:
+            future = write_behind.submit(values)
+            try:
+                transaction_id = future.result(timeout=app.config['WRITE_BEHIND_TIMEOUT'])
+            except FutureTimeoutError:
+                # Once cancelled the row is never written, so a retry is safe.
+                # Otherwise its batch is already committing, and busy_timeout
+                # bounds how long that can take.
+                if future.cancel():
+                    raise
+                transaction_id = future.result()
+            return Transaction(id=transaction_id, **values)
+        transaction = Transaction(**values)
+        db.session.add(transaction)
+        db.session.commit()
+        return transaction
+
+    try:
+        new_transaction = with_category_ids([values], write)
+    except queue.Full:
+        retry_after = str(app.config['WRITE_BEHIND_RETRY_AFTER'])
+        return jsonify({'error': 'Too many pending writes, try again later'}), 503, {'Retry-After': retry_after}
+    except FutureTimeoutError:
+        retry_after = str(app.config['WRITE_BEHIND_RETRY_AFTER'])
+        return jsonify({'error': 'Timed out waiting for the write, it was not saved'}), 503, {'Retry-After': retry_after}
+    return jsonify(new_transaction.to_dict()), 201
+
+@app.route('/transactions/batch', methods=['POST'])
+def add_transactions_batch():
     data = request.json
-    new_transaction = Transaction(
-        trans_type=data['trans_type'],
-        amount=data['amount'],
-        category=data['category'],
-        date=data['date']
-    )
-    db.session.add(new_transaction)
+    if not isinstance(data, list):
+        return jsonify({'error': 'Expected a JSON array of transactions'}), 400
+    rows = []
+    for index, item in enumerate(data):
+        try:
+            rows.append(parse_transaction(item))
+        except ValueError as e:
+            return jsonify({'error': f'Transaction {index}: {e}'}), 400
+
+    # One Core executemany INSERT per chunk, committed as it goes, so very
+    # large bodies don't hold a single huge write transaction open. SQLite
+    # hands out max(rowid) + 1 to each new row and nobody else can write
+    # while we hold the transaction, so a chunk's ids are the contiguous run
+    # ending at max(id) -- much cheaper than RETURNING through the ORM.
+    chunk_size = app.config['BATCH_CHUNK_SIZE']
+    ids = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+
+        def write():
+            db.session.execute(insert(Transaction.__table__), chunk)
+            last_id = db.session.scalar(select(func.max(Transaction.id)))
+            db.session.commit()
+            return range(last_id - len(chunk) + 1, last_id + 1)
+
+        ids.extend(with_category_ids(chunk, write))
+    return jsonify({'ids': ids}), 201
+
+def select_for_bulk(statement, data):
+    """Restrict a bulk UPDATE or DELETE to `ids` in the body and the
+    GET /transactions filters in the query string.
+
+    An unrestricted request is refused rather than rewriting the whole ledger.
+    """
+    filters = parse_filters(request.args)
+    ids = data.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ValueError('ids must be a list of integers')
+        # json_each binds the whole list as one parameter, so any number of
+        # ids stays a single statement under SQLite's variable limit.
+        listed = func.json_each(json.dumps(ids)).table_valued('value')
+        statement = statement.where(Transaction.id.in_(select(listed.c.value)))
+    elif all(value is None for value in filters):
+        raise ValueError('Select transactions with ids or at least one filter')
+    return filter_transactions(statement, filters)
+
+def bulk_body():
+    data = request.get_json(silent=True) if request.content_length else {}
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    return data
+
+@app.route('/transactions', methods=['DELETE'])
+def delete_transactions():
+    """Delete every selected transaction with one DELETE statement.
+
+    The ledger triggers keep totals, the rollup and the change log in step
+    row by row, inside the same transaction.
+    """
+    try:
+        statement = select_for_bulk(delete(Transaction), bulk_body())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    deleted = db.session.execute(statement.execution_options(synchronize_session=False)).rowcount
     db.session.commit()
-    return jsonify(new_transaction.to_dict()), 201
+    return jsonify({'deleted': deleted})
+
+@app.route('/transactions', methods=['PATCH'])
+def update_transactions():
+    """Set fields on every selected transaction with one UPDATE statement.
+
+    Rows that already hold the new values are left alone, so they don't
+    churn the change log or count as updated.
+    """
+    try:
+        data = bulk_body()
+        values = parse_changes(data.get('set'))
+        statement = select_for_bulk(update(Transaction), data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def write():
+        changed = statement.values(**values).where(
+            or_(*(getattr(Transaction, column) != value for column, value in values.items()))
+        )
+        updated = db.session.execute(changed.execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        return updated
+
+    return jsonify({'updated': with_category_ids([values], write)})
+
+BATCH_OPERATIONS = ('create', 'update', 'delete')
+
+def parse_operation(data):
+    """Validate one /batch operation into (op, transaction id, values)."""
+    if not isinstance(data, dict) or data.get('op') not in BATCH_OPERATIONS:
+        raise ValueError('op must be one of: ' + ', '.join(BATCH_OPERATIONS))
+    if data['op'] == 'create':
+        return 'create', None, parse_transaction(data.get('transaction'))
+    transaction_id = data.get('id')
+    if not is_row_id(transaction_id):
+        raise ValueError('id must be an integer')
+    if data['op'] == 'update':
+        return 'update', transaction_id, parse_changes(data.get('set'))
+    return 'delete', transaction_id, None
+
+@app.route('/batch', methods=['POST'])
+def run_batch():
+    """Apply an ordered list of creates, updates and deletes in one transaction.
+
+    Either every operation is applied and committed together, or none is.
+    Each result mirrors what the single-transaction endpoint would answer.
+    """
+    data = request.json
+    if not isinstance(data, list):
+        return jsonify({'error': 'Expected a JSON array of operations'}), 400
+    operations = []
+    for index, item in enumerate(data):
+        try:
+            operations.append(parse_operation(item))
+        except ValueError as e:
+            return jsonify({'error': f'Operation {index}: {e}'}), 400
+
+    def write():
+        results = []
+        for index, (op, transaction_id, values) in enumerate(operations):
+            if op == 'create':
+                transaction = Transaction(**values)
+                db.session.add(transaction)
+                db.session.flush()
+                results.append({'status': 201, 'transaction': transaction.to_dict()})
+                continue
+            transaction = db.session.get(Transaction, transaction_id)
+            if transaction is None:
+                db.session.rollback()
+                return jsonify({'error': f'Operation {index}: Transaction not found'}), 404
+            if op == 'update':
+                for column, value in values.items():
+                    setattr(transaction, column, value)
+                db.session.flush()
+                results.append({'status': 200, 'transaction': transaction.to_dict()})
+            else:
+                db.session.delete(transaction)
+                db.session.flush()
+                results.append({'status': 204})
+        db.session.commit()
+        return jsonify({'results': results})
+
+    return with_category_ids([values for _, _, values in operations if values], write)
+
+IMPORT_READ_SIZE = 1 << 16
+
+def read_lines(stream):
+    """Yield the raw lines of a request body without buffering the whole body.
+
+    Werkzeug's length-limited stream is unbuffered and its readline() fetches
+    a byte at a time, so read blocks and split them here instead.
+    """
+    limit = app.config['IMPORT_MAX_LINE']
+    pending = b''
+    while True:
+        block = stream.read(IMPORT_READ_SIZE)
+        if not block:
+            break
+        data = pending + block
+        start = 0
+        end = data.find(b'\n')
+        while end != -1:
+            yield data[start:end + 1]
+            start = end + 1
+            end = data.find(b'\n', start)
+        pending = data[start:]
+        if len(pending) > limit:
+            raise ValueError(f'line is longer than {limit} bytes')
+    if pending:
+        yield pending
+
+def jsonl_records(lines, job):
+    for line in lines:
+        text = line.strip()
+        yield (json.loads(text) if text else None), len(line), 1
+
+def csv_records(lines, job):
+    """Like jsonl_records, keyed by the header row remembered on the job.
+
+    The reader pulls physical lines one at a time, so a quoted field may
+    span lines and each record's size is exactly what it consumed.
+    """
+    consumed = [0, 0]
+    def decoded():
+        # Only the very first line of a file can carry a byte order mark.
+        encoding = 'utf-8-sig' if job['offset'] == 0 else 'utf-8'
+        for line in lines:
+            consumed[0] += len(line)
+            consumed[1] += 1
+            yield line.decode(encoding)
+            encoding = 'utf-8'
+    reader = csv.reader(decoded())
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            raise ValueError(f'malformed CSV: {e}')
+        size, count = consumed
+        consumed[:] = [0, 0]
+        if job['columns'] is None:
+            missing = [field for field in TRANSACTION_FIELDS if field not in record]
+            if missing:
+                raise ValueError('CSV header is missing column(s): ' + ', '.join(missing))
+            job['columns'] = record
+            yield None, size, count
+        elif not record:
+            yield None, size, count
+        elif len(record) != len(job['columns']):
+            raise ValueError(f"expected {len(job['columns'])} columns, got {len(record)}")
+        else:
+            data = dict(zip(job['columns'], record))
+            try:
+                data['amount'] = float(data['amount'])
+            except ValueError:
+                raise ValueError('amount must be a positive number')
+            yield data, size, count
+
+IMPORT_FORMATS = {'jsonl': jsonl_records, 'csv': csv_records}
+
+def commit_import_chunk(job, rows, size, lines):
+    """Insert one chunk and advance the job's counters in the same commit."""
+    def write():
+        if rows:
+            db.session.execute(insert(Transaction.__table__), rows)
+        db.session.execute(update(ImportJob).where(ImportJob.id == job['id']).values(
+            columns=json.dumps(job['columns']) if job['columns'] is not None else None,
+            committed_bytes=job['offset'] + size,
+            committed_lines=job['lines'] + lines,
+            committed_rows=job['rows'] + len(rows)
+        ))
+        db.session.commit()
+
+    # Categories are committed on their own connection, so they are resolved
+    # before this session starts its write transaction.
+    with_category_ids(rows, write)
+    job['offset'] += size
+    job['lines'] += lines
+    job['rows'] += len(rows)
+
+def finish_import(job_id, status, error=None):
+    db.session.execute(update(ImportJob).where(ImportJob.id == job_id).values(status=status, error=error))
+    db.session.commit()
+    return db.session.get(ImportJob, job_id)
+
+@app.route('/imports', methods=['POST'])
+def create_import():
+    """Start an import job; upload its data with PUT /imports/<id>."""
+    import_format = request.args.get('format', 'jsonl')
+    if import_format not in IMPORT_FORMATS:
+        return jsonify({'error': 'format must be one of: ' + ', '.join(IMPORT_FORMATS)}), 400
+    job = ImportJob(format=import_format)
+    db.session.add(job)
+    db.session.commit()
+    return jsonify(job.to_dict()), 201, {'Location': url_for('get_import', job_id=job.id)}
+
+@app.route('/imports/<int:job_id>', methods=['GET'])
+def get_import(job_id):
+    job = db.session.get(ImportJob, job_id)
+    if job is None:
+        return jsonify({'error': 'Import not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/imports/<int:job_id>', methods=['PUT'])
+def upload_import(job_id):
+    """Stream JSONL or CSV into the ledger, committing every IMPORT_CHUNK_SIZE rows.
+
+    The body is read and validated line by line, so memory stays flat
+    however large it is. `offset` must equal the job's committed offset:
+    0 for a new job, or where a failed or interrupted upload stopped, with
+    the body starting at that byte of the source.
+    """
+    try:
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'offset must be an integer'}), 400
+    # Claiming the job atomically keeps two uploads from writing it at once.
+    claimed = db.session.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job_id, ImportJob.committed_bytes == offset,
+               ImportJob.status.in_(['pending', 'failed', 'interrupted']))
+        .values(status='running', error=None)
+    ).rowcount
+    db.session.commit()
+    job = db.session.get(ImportJob, job_id)
+    if job is None:
+        return jsonify({'error': 'Import not found'}), 404
+    if not claimed:
+        if job.status in ('pending', 'failed', 'interrupted'):
+            return jsonify({'error': f'offset must be {job.committed_bytes}, where this import stopped'}), 409
+        return jsonify({'error': f'Import is already {job.status}'}), 409
+    state = {
+        'id': job.id,
+        'columns': json.loads(job.columns) if job.columns is not None else None,
+        'offset': job.committed_bytes,
+        'lines': job.committed_lines,
+        'rows': job.committed_rows
+    }
+    records = IMPORT_FORMATS[job.format](read_lines(request.stream), state)
+    db.session.commit()  # end the read transaction before chunks start writing
+
+    chunk_size = app.config['IMPORT_CHUNK_SIZE']
+    rows, size, lines = [], 0, 0
+    try:
+        for data, record_size, record_lines in records:
+            if data is not None:
+                rows.append(parse_transaction(data))
+            size += record_size
+            lines += record_lines
+            if len(rows) >= chunk_size:
+                commit_import_chunk(state, rows, size, lines)
+                rows, size, lines = [], 0, 0
+        commit_import_chunk(state, rows, size, lines)
+    except ValueError as e:
+        db.session.rollback()
+        job = finish_import(job_id, 'failed', f"Line {state['lines'] + lines + 1}: {e}")
+        return jsonify({'error': job.error, 'import': job.to_dict()}), 400
+    except Exception:
+        # Typically the client went away mid-upload; keep what was committed.
+        db.session.rollback()
+        finish_import(job_id, 'interrupted')
+        raise
+    return jsonify(finish_import(job_id, 'complete').to_dict())
+
+@app.route('/transactions/count', methods=['GET'])
+@conditional
+def get_transaction_count():
+    try:
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    count = count_transactions(*filters)
+    response = jsonify({'count': count})
+    response.headers['X-Total-Count'] = count
+    return response
+
+@app.route('/transactions/changes', methods=['GET'])
+@conditional
+def get_changes():
+    """Everything that changed after version `since`, as current state.
+
+    Repeated changes to one transaction collapse into a single upsert, or
+    into a delete if the row is gone now, so applying a response is
+    idempotent. Page on with `since=<version>` while `more` is true.
+    """
+    version = current_data_version()
+    compacted = db.session.get(ChangeLogState, 1).compacted
+    try:
+        since = int(request.args.get('since', version))
+        limit = parse_limit(request.args.get('limit', app.config['MAX_PAGE_SIZE']))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if since < 0:
+        return jsonify({'error': 'since must be a version, 0 or greater'}), 400
+    if since < compacted:
+        return jsonify({'error': 'The change log has been compacted past this version; resync from GET /transactions'}), 410
+    if since > version:
+        # Versions never go backwards, so this one came from another copy of
+        # the database (a restore or a reset); the client's mirror is stale.
+        return jsonify({'error': 'This version is ahead of the change log; resync from GET /transactions'}), 410
+
+    changes = db.session.execute(
+        select(Change.version, Change.transaction_id)
+        .where(Change.version > since)
+        .order_by(Change.version)
+        .limit(limit + 1)
+    ).all()
+    more = len(changes) > limit
+    changes = changes[:limit]
+    ids = {transaction_id for _, transaction_id in changes}
+    current, to_dicts = [], models_to_dicts
+    if ids:
+        result, to_dicts = execute_transactions(select(Transaction).where(Transaction.id.in_(ids)))
+        current = result.all()
+    return jsonify({
+        'version': changes[-1].version if more else version,
+        'upserts': to_dicts(current),
+        'deletes': sorted(ids - {t.id for t in current}),
+        'more': more
+    })
+
+@app.route('/status', methods=['GET'])
+@conditional
+def get_status():
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(status_report(start, end))
+
+@report_cache.memoize
+def status_report(start, end):
+    if start is None and end is None:
+        totals = db.session.get(Totals, 1)
+        total_income = totals.income_cents
+        total_expense = totals.expense_cents
+    else:
+        totals = sum_by('trans_type', start, end)
+        total_income = totals.get('income') or 0
+        total_expense = totals.get('expense') or 0
+    return {
+        'total_income': from_cents(total_income),
+        'total_expense': from_cents(total_expense),
+        'balance': from_cents(total_income - total_expense)
+    }
+
+@app.route('/reports/category', methods=['GET'])
+@conditional
+def get_category_report():
+    trans_type = request.args.get('trans_type', 'expense')
+    if trans_type not in TRANSACTION_TYPES:
+        return jsonify({'error': 'trans_type must be one of: ' + ', '.join(TRANSACTION_TYPES)}), 400
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(category_report(trans_type, start, end))
+
+@report_cache.memoize
+def category_report(trans_type, start, end):
+    report = sum_by('category_id', start, end, trans_type)
+    return {category_cache.name(category_id): from_cents(total) for category_id, total in report.items()}
+
+@report_cache.memoize
+def count_transactions(trans_type, category_ids, start, end, min_cents, max_cents):
+    """Number of transactions matching parse_filters() output."""
+    if min_cents is None and max_cents is None:
+        # The rollup keeps a row count per month, category and type.
+        counts = sum_by('category_id', start, end, trans_type, measure='count')
+        return sum(count for category_id, count in counts.items() if category_ids is None or category_id in category_ids)
+    statement = select(func.count()).select_from(Transaction)
+    filters = (trans_type, category_ids, start, end, min_cents, max_cents)
+    return db.session.execute(filter_transactions(statement, filters)).scalar()
+
+@app.route('/reports/cache', methods=['GET'])
+def get_report_cache_stats():
+    return jsonify(report_cache.stats())
+
+@app.route('/categories', methods=['GET'])
+def get_categories():
+    categories = Category.query.order_by(Category.name).all()
+    return jsonify([c.to_dict() for c in categories])
+
+@app.route('/categories', methods=['POST'])
+def add_category():
+    data = request.json
+    name = data.get('name') if isinstance(data, dict) else None
+    if not isinstance(name, str) or not name:
+        return jsonify({'error': 'name must be a non-empty string'}), 400
+    existing = category_cache.id(name)
+    if existing is not None:
+        return jsonify({'id': existing, 'name': name}), 200
+    category_id = category_cache.resolve([name])[name]
+    return jsonify({'id': category_id, 'name': name}), 201
+
+@app.route('/categories/<int:category_id>', methods=['DELETE'])
+def delete_category(category_id):
+    category = db.session.get(Category, category_id)
+    if category is None:
+        return jsonify({'error': 'Category not found'}), 404
+    in_use = db.session.scalar(select(Transaction.id).where(Transaction.category_id == category_id).limit(1))
+    if in_use is not None:
+        return jsonify({'error': 'Category is still used by transactions'}), 409
+    db.session.delete(category)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A transaction took the category between the check and the delete.
+        db.session.rollback()
+        return jsonify({'error': 'Category is still used by transactions'}), 409
+    category_cache.clear()
+    return '', 204
 
 @app.route('/transactions/<int:transaction_id>', methods=['DELETE'])
 def delete_transaction(transaction_id):
@@ -50,5 +1915,6 @@ def delete_transaction(transaction_id):
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        init_db()
+    start_maintenance()
     app.run(debug=True)
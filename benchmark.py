@@ -0,0 +1,380 @@
+"""Benchmarks for the budget API.
+
+Each benchmark seeds a scratch SQLite database with synthetic transactions,
+drives the Flask app in-process through its test client and prints timings
+(best of several runs) together with the query plans SQLite chose.
+
+    python benchmark.py indexes --rows 1000000
+    python benchmark.py reports --rows 1000000
+    python benchmark.py concurrency --rows 100000 --seconds 10
+    python benchmark.py writes --clients 16 --seconds 10
+    python benchmark.py compression --rows 1000000
+    python benchmark.py reads --rows 100000
+    python benchmark.py export --rows 1000000
+"""
+import argparse
+import json
+import os
+import zlib
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+os.environ.setdefault('BUDGET_SQLALCHEMY_DATABASE_URI', 'sqlite:///' + DB_PATH)
+
+from sqlalchemy import event, func, select
+
+import ledger_format
+
+from app import app, db, init_db, category_cache, encode_cursor, execute_transactions, Transaction
+
+CATEGORIES = [
+    'Groceries', 'Rent', 'Utilities', 'Fuel', 'Dining', 'Insurance', 'Phone',
+    'Internet', 'Clothing', 'Gifts', 'Travel', 'Health', 'Fitness', 'Books',
+    'Music', 'Games', 'Pets', 'Childcare', 'Education', 'Charity', 'Taxes',
+    'Repairs', 'Furniture', 'Electronics', 'Subscriptions', 'Parking',
+    'Transit', 'Coffee', 'Salary', 'Freelance',
+]
+
+
+def generate_transactions(count, seed=0):
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    for _ in range(count):
+        yield {
+            'trans_type': 'income' if rng.random() < 0.1 else 'expense',
+            'amount': round(rng.uniform(1, 500), 2),
+            'category': rng.choice(CATEGORIES),
+            'date': (start + timedelta(days=rng.randrange(3650))).isoformat()
+        }
+
+
+def seed(client, rows, chunk_size=50000):
+    started = time.perf_counter()
+    chunk = []
+    for transaction in generate_transactions(rows):
+        chunk.append(transaction)
+        if len(chunk) == chunk_size:
+            client.post('/transactions/batch', json=chunk)
+            chunk = []
+    if chunk:
+        client.post('/transactions/batch', json=chunk)
+    print(f'Seeded {rows} rows in {time.perf_counter() - started:.1f}s')
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+class StatementCapture:
+    """Record every SQL statement the engine executes while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+
+def report(workloads):
+    """Time each workload and print the plan of every SELECT it issues."""
+    for name, func in workloads:
+        with StatementCapture(db.engine) as capture:
+            func()
+        elapsed = best_of(func)
+        print(f'  {name}: {elapsed * 1000:.2f} ms')
+        with db.engine.connect() as connection:
+            for statement, parameters in capture.statements:
+                if not statement.lstrip().upper().startswith('SELECT'):
+                    continue
+                plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+                for row in plan:
+                    print(f'      {row[-1]}')
+
+
+def bench_indexes(args):
+    client = app.test_client()
+    with app.app_context():
+        init_db()
+        seed(client, args.rows)
+        middle = db.session.get(Transaction, args.rows // 2)
+        cursor = encode_cursor(middle)
+        db.session.remove()
+
+        groceries = category_cache.id('Groceries')
+
+        def category_history():
+            Transaction.query.filter_by(category_id=groceries).order_by(Transaction.date).limit(100).all()
+            db.session.remove()
+
+        workloads = [
+            ('GET /transactions?limit=100 (mid-ledger page)',
+             lambda: client.get('/transactions', query_string={'limit': 100, 'after': cursor})),
+            ('GET /status', lambda: client.get('/status')),
+            ('GET /reports/category', lambda: client.get('/reports/category')),
+            ('Groceries history, oldest 100', category_history),
+        ]
+
+        indexes = list(Transaction.__table__.indexes)
+        with db.engine.begin() as connection:
+            for index in indexes:
+                index.drop(connection)
+        print('Before (no secondary indexes):')
+        report(workloads)
+
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            for index in indexes:
+                index.create(connection)
+            connection.exec_driver_sql('ANALYZE')
+        # Drop pooled connections so none of them keep statements prepared
+        # against the index-less schema.
+        db.engine.dispose()
+        print(f'Building indexes and ANALYZE took {time.perf_counter() - started:.1f}s')
+        print('After:')
+        report(workloads)
+
+
+def bench_reports(args):
+    client = app.test_client()
+    with app.app_context():
+        init_db()
+        seed(client, args.rows)
+
+        def ledger_scan():
+            db.session.execute(
+                select(Transaction.category_id, func.sum(Transaction.amount_cents))
+                .where(Transaction.trans_type == 'expense', Transaction.date.between(date(2023, 1, 1), date(2023, 12, 31)))
+                .group_by(Transaction.category_id)
+            ).all()
+            db.session.remove()
+
+        report([
+            ('12-month category report summed from the ledger', ledger_scan),
+            ('GET /reports/category, 12 whole months',
+             lambda: client.get('/reports/category', query_string={'from': '2023-01-01', 'to': '2023-12-31'})),
+            ('GET /reports/category, 12 months with partial edges',
+             lambda: client.get('/reports/category', query_string={'from': '2023-01-15', 'to': '2024-01-14'})),
+            ('GET /status, 12 whole months',
+             lambda: client.get('/status', query_string={'from': '2023-01-01', 'to': '2023-12-31'})),
+        ])
+
+ROLLBACK_JOURNAL = {'busy_timeout': 5000, 'journal_mode': 'delete', 'synchronous': 'full'}
+
+
+def hammer(workers, seconds):
+    """Run each (name, request) worker on its own thread; count completed and failed calls."""
+    stop = time.perf_counter() + seconds
+    counts = {name: [0, 0] for name, _ in workers}
+    lock = threading.Lock()
+
+    def loop(name, call):
+        client = app.test_client()
+        while time.perf_counter() < stop:
+            ok = call(client).status_code < 500
+            with lock:
+                counts[name][0 if ok else 1] += 1
+
+    threads = [threading.Thread(target=loop, args=worker) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def bench_concurrency(args):
+    with app.app_context():
+        init_db()
+        seed(app.test_client(), args.rows)
+        after = encode_cursor(db.session.get(Transaction, args.rows // 2))
+        db.session.remove()
+
+    def read(client):
+        return client.get('/transactions', query_string={'limit': 100, 'after': after})
+
+    def write(client):
+        return client.post('/transactions', json=next(generate_transactions(1, seed=random.random())))
+
+    workers = [(f'GET #{n}', read) for n in range(args.readers)]
+    workers += [(f'POST #{n}', write) for n in range(args.writers)]
+    profiles = [('rollback journal, synchronous=full', ROLLBACK_JOURNAL), ('default profile', app.config['SQLITE_PRAGMAS'])]
+    for name, pragmas in profiles:
+        app.config['SQLITE_PRAGMAS'] = pragmas
+        with app.app_context():
+            db.engine.dispose()
+        counts = hammer(workers, args.seconds)
+        reads = sum(done for worker, (done, _) in counts.items() if worker.startswith('GET'))
+        writes = sum(done for worker, (done, _) in counts.items() if worker.startswith('POST'))
+        failed = sum(errors for _, errors in counts.values())
+        print(f'{name} ({pragmas}):')
+        print(f'  GET {reads / args.seconds:.0f}/s, POST {writes / args.seconds:.0f}/s, {failed} failed')
+
+
+def bench_writes(args):
+    with app.app_context():
+        init_db()
+
+    def write(client):
+        return client.post('/transactions', json=next(generate_transactions(1, seed=random.random())))
+
+    workers = [(f'POST #{n}', write) for n in range(args.clients)]
+    profile = app.config['SQLITE_PRAGMAS']
+    modes = [
+        ('commit per request, synchronous=full', dict(profile, synchronous='full'), False),
+        ('commit per request, synchronous=normal', profile, False),
+        ('write-behind group commit, synchronous=full', profile, True),
+    ]
+    for name, pragmas, write_behind in modes:
+        app.config.update(SQLITE_PRAGMAS=pragmas, WRITE_BEHIND=write_behind)
+        with app.app_context():
+            db.engine.dispose()
+        counts = hammer(workers, args.seconds)
+        done = sum(ok for ok, _ in counts.values())
+        failed = sum(errors for _, errors in counts.values())
+        print(f'{name}: {done / args.seconds:.0f} POST/s, {failed} failed')
+
+
+def bench_compression(args):
+    client = app.test_client()
+    with app.app_context():
+        init_db()
+        seed(client, args.rows)
+
+    exports = [
+        ('JSON', '/transactions'),
+        ('columnar JSON', '/transactions?layout=columnar'),
+        ('NDJSON', '/transactions?format=ndjson'),
+    ]
+    for name, path in exports:
+        print(f'{name} export of {args.rows} rows:')
+        for encoding in ('identity', 'gzip', 'deflate'):
+            def fetch():
+                response = client.get(path, headers={'Accept-Encoding': encoding})
+                body = response.get_data()
+                # Include the client's decompression in the end-to-end time.
+                text = body
+                if encoding != 'identity':
+                    text = zlib.decompress(body, 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS)
+                # ...and its JSON parsing.
+                if response.mimetype == 'application/x-ndjson':
+                    [json.loads(line) for line in text.splitlines()]
+                else:
+                    json.loads(text)
+                return len(body)
+            size = fetch()
+            elapsed = best_of(fetch, repeat=3)
+            print(f'  {encoding}: {size / 1e6:.1f} MB on the wire, {elapsed * 1000:.0f} ms')
+
+
+def bench_reads(args):
+    client = app.test_client()
+    with app.app_context():
+        init_db()
+        seed(client, args.rows)
+
+    def serialize():
+        # Query plus serialization only, without the HTTP layer around it.
+        with app.test_request_context('/transactions'):
+            result, to_dicts = execute_transactions(select(Transaction))
+            to_dicts(result.all())
+            db.session.remove()
+
+    workloads = [
+        ('select + serialize', serialize),
+        ('GET /transactions', lambda: client.get('/transactions')),
+        ('GET /transactions?format=ndjson', lambda: client.get('/transactions?format=ndjson').get_data()),
+    ]
+    fast_endpoints = app.config['FAST_READ_ENDPOINTS']
+    for path, endpoints in (('ORM path', []), ('fast path', fast_endpoints)):
+        app.config['FAST_READ_ENDPOINTS'] = endpoints
+        print(f'{path}:')
+        for name, func in workloads:
+            elapsed = best_of(func, repeat=3)
+            print(f'  {name}: {args.rows / elapsed:,.0f} rows/s')
+
+
+def bench_export(args):
+    client = app.test_client()
+    with app.app_context():
+        init_db()
+        seed(client, args.rows)
+
+    def binary():
+        data = client.get('/export', query_string={'format': 'bin'}).get_data()
+        with ledger_format.Ledger(data) as ledger:
+            for _ in ledger:
+                pass
+        return len(data)
+
+    def ndjson():
+        data = client.get('/transactions', query_string={'format': 'ndjson'}).get_data()
+        for line in data.splitlines():
+            json.loads(line)
+        return len(data)
+
+    for name, func in (('NDJSON', ndjson), ('binary', binary)):
+        size = func()
+        elapsed = best_of(func, repeat=3)
+        print(f'{name}: {size / 1e6:.1f} MB, export + decode in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    indexes = subparsers.add_parser('indexes', help='query plans and timings with and without the transaction indexes')
+    indexes.add_argument('--rows', type=int, default=1000000)
+    indexes.set_defaults(func=bench_indexes)
+
+    reports = subparsers.add_parser('reports', help='report timings from the monthly rollup against a ledger scan')
+    reports.add_argument('--rows', type=int, default=1000000)
+    reports.set_defaults(func=bench_reports)
+
+    concurrency = subparsers.add_parser('concurrency', help='mixed GET/POST throughput under each storage profile')
+    concurrency.add_argument('--rows', type=int, default=100000)
+    concurrency.add_argument('--seconds', type=float, default=10)
+    concurrency.add_argument('--readers', type=int, default=4)
+    concurrency.add_argument('--writers', type=int, default=2)
+    concurrency.set_defaults(func=bench_concurrency)
+
+    writes = subparsers.add_parser('writes', help='POST throughput with and without the write-behind queue')
+    writes.add_argument('--clients', type=int, default=16)
+    writes.add_argument('--seconds', type=float, default=10)
+    writes.set_defaults(func=bench_writes)
+
+    compression = subparsers.add_parser('compression', help='bytes on the wire and latency of ledger exports per encoding')
+    compression.add_argument('--rows', type=int, default=100000)
+    compression.set_defaults(func=bench_compression)
+
+    reads = subparsers.add_parser('reads', help='rows/s of the ORM read path against the column-tuple fast path')
+    reads.add_argument('--rows', type=int, default=100000)
+    reads.set_defaults(func=bench_reads)
+
+    export = subparsers.add_parser('export', help='binary ledger export against NDJSON, produced and decoded')
+    export.add_argument('--rows', type=int, default=1000000)
+    export.set_defaults(func=bench_export)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
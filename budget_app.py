@@ -1,45 +1,40 @@
 import json
+import sqlite3
 from datetime import datetime
 import tkinter as tk
 from tkinter import messagebox, ttk
-from flask import Flask, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
-
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///budget.db'
-db = SQLAlchemy(app)
-
-class Transaction(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    trans_type = db.Column(db.String(50))
-    amount = db.Column(db.Float)
-    category = db.Column(db.String(50))
-    date = db.Column(db.String(50))
-
-@app.route('/transactions', methods=['GET'])
-def get_transactions():
-    transactions = Transaction.query.all()
-    return jsonify([t.to_dict() for t in transactions])
-
-@app.route('/transactions', methods=['POST'])
-def add_transaction():
-    data = request.json
-    new_transaction = Transaction(
-        trans_type=data['trans_type'],
-        amount=data['amount'],
-        category=data['category'],
-        date=data['date']
-    )
-    db.session.add(new_transaction)
-    db.session.commit()
-    return jsonify(new_transaction.to_dict()), 201
-
-if __name__ == '__main__':
-    db.create_all()
-    app.run(debug=True)
+
+from money import MAX_CENTS, format_cents, round_to_cents, to_cents
+
+
+# Applied to every connection Budget opens; in-memory databases ignore the
+# journal settings.
+STORAGE_PRAGMAS = {
+    "busy_timeout": 5000,
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "cache_size": -64000,
+    "mmap_size": 268435456,
+    "temp_store": "memory",
+}
+
+def parse_date(date):
+    try:
+        return datetime.strptime(date, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid date {date}, expected YYYY-MM-DD.")
+
+def check_cents(amount):
+    # Budget takes integer cents; convert user input with to_cents first.
+    if not isinstance(amount, int) or isinstance(amount, bool):
+        raise ValueError(f"Amount must be integer cents, got {amount!r}.")
+    if abs(amount) > MAX_CENTS:
+        raise ValueError(f"Amount can't be more than {format_cents(MAX_CENTS)}.")
+    return amount
 
 
 class Transaction:
+    # amount is always in integer cents.
     def __init__(self, trans_type, amount, category, date=None):
         self.trans_type = trans_type
         self.amount = amount
@@ -49,79 +44,220 @@ class Transaction:
     def to_dict(self):
         return {
             "trans_type": self.trans_type,
-            "amount": self.amount,
+            "amount_cents": self.amount,
             "category": self.category,
             "date": self.date
         }
 
     @staticmethod
     def from_dict(data):
-        return Transaction(data["trans_type"], data["amount"], data["category"], data["date"])
-
-class Budget:
-    import sqlite3
+        if "amount_cents" in data:
+            amount = data["amount_cents"]
+        else:
+            # Files saved before amounts were stored in cents.
+            amount = round_to_cents(data["amount"])
+        return Transaction(data["trans_type"], amount, data["category"], data["date"])
 
 class Budget:
-    def __init__(self, db_path='budget.db'):
+    def __init__(self, db_path=':memory:', pragmas=None):
         self.conn = sqlite3.connect(db_path)
+        for name, value in (STORAGE_PRAGMAS if pragmas is None else pragmas).items():
+            self.conn.execute(f'PRAGMA {name} = {value}')
         self.create_tables()
 
+    def checkpoint(self):
+        return self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+
     def create_tables(self):
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(transactions)')]
+        tables = [row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        migrated = 'amount' in columns
+        if migrated:
+            self.migrate_amounts_to_cents()
         with self.conn:
             self.conn.execute('''
                 CREATE TABLE IF NOT EXISTS transactions (
                     id INTEGER PRIMARY KEY,
                     trans_type TEXT,
-                    amount REAL,
+                    amount_cents INTEGER,
                     category TEXT,
                     date TEXT
                 )
             ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date)')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS categories (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                )
+            ''')
+            self.conn.execute('''
+                INSERT OR IGNORE INTO categories (name)
+                SELECT DISTINCT category FROM transactions WHERE category IS NOT NULL
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS totals (
+                    id INTEGER PRIMARY KEY,
+                    income_cents INTEGER NOT NULL,
+                    expense_cents INTEGER NOT NULL
+                )
+            ''')
+            # Running totals kept current by triggers, so view_status reads
+            # one row instead of summing the whole ledger.
+            self.conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS transactions_totals_insert AFTER INSERT ON transactions BEGIN
+                    UPDATE totals SET
+                        income_cents = income_cents + CASE NEW.trans_type WHEN 'income' THEN NEW.amount_cents ELSE 0 END,
+                        expense_cents = expense_cents + CASE NEW.trans_type WHEN 'expense' THEN NEW.amount_cents ELSE 0 END
+                    WHERE id = 1;
+                END
+            ''')
+            self.conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS transactions_totals_delete AFTER DELETE ON transactions BEGIN
+                    UPDATE totals SET
+                        income_cents = income_cents - CASE OLD.trans_type WHEN 'income' THEN OLD.amount_cents ELSE 0 END,
+                        expense_cents = expense_cents - CASE OLD.trans_type WHEN 'expense' THEN OLD.amount_cents ELSE 0 END
+                    WHERE id = 1;
+                END
+            ''')
+            # Per-month sums by category and type, so reports don't have to
+            # aggregate raw rows either.
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS monthly_rollup (
+                    month TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    trans_type TEXT NOT NULL,
+                    total_cents INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (month, category, trans_type)
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS transactions_rollup_insert AFTER INSERT ON transactions BEGIN
+                    INSERT INTO monthly_rollup (month, category, trans_type, total_cents, count)
+                    VALUES (substr(NEW.date, 1, 7), NEW.category, NEW.trans_type, NEW.amount_cents, 1)
+                    ON CONFLICT DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+                END
+            ''')
+            self.conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS transactions_rollup_delete AFTER DELETE ON transactions BEGIN
+                    UPDATE monthly_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+                    WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category AND trans_type = OLD.trans_type;
+                    DELETE FROM monthly_rollup
+                    WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category AND trans_type = OLD.trans_type
+                      AND count = 0;
+                END
+            ''')
+        if migrated or self.conn.execute('SELECT 1 FROM totals WHERE id = 1').fetchone() is None:
+            self.rebuild_totals()
+        if migrated or 'monthly_rollup' not in tables:
+            with self.conn:
+                self.conn.execute('DELETE FROM monthly_rollup')
+                self.conn.execute('''
+                    INSERT INTO monthly_rollup (month, category, trans_type, total_cents, count)
+                    SELECT substr(date, 1, 7), category, trans_type, SUM(amount_cents), COUNT(*)
+                    FROM transactions
+                    GROUP BY 1, 2, 3
+                ''')
+
+    def migrate_amounts_to_cents(self):
+        # Rebuild the table so amounts get INTEGER affinity; in a REAL column
+        # SQLite would turn the converted values straight back into floats.
+        with self.conn:
+            self.conn.execute('BEGIN')
+            self.conn.execute('ALTER TABLE transactions RENAME TO transactions_old')
+            self.conn.execute('''
+                CREATE TABLE transactions (
+                    id INTEGER PRIMARY KEY,
+                    trans_type TEXT,
+                    amount_cents INTEGER,
+                    category TEXT,
+                    date TEXT
+                )
+            ''')
+            self.conn.execute('''
+                INSERT INTO transactions (id, trans_type, amount_cents, category, date)
+                SELECT id, trans_type, CAST(ROUND(amount * 100) AS INTEGER), category, date
+                FROM transactions_old
+            ''')
+            self.conn.execute('DROP TABLE transactions_old')
 
     def add_transaction(self, trans_type, amount, category, date=None):
-        date = date if date else datetime.now().strftime("%Y-%m-%d")
+        check_cents(amount)
+        date = parse_date(date) if date else datetime.now().strftime("%Y-%m-%d")
         with self.conn:
-            self.conn.execute('''
-                INSERT INTO transactions (trans_type, amount, category, date)
+            self.conn.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (category,))
+            cursor = self.conn.execute('''
+                INSERT INTO transactions (trans_type, amount_cents, category, date)
                 VALUES (?, ?, ?, ?)
             ''', (trans_type, amount, category, date))
-
-    def get_transactions(self):
+        return cursor.lastrowid
+
+    def get_transactions(self, start=None, end=None):
+        query = 'SELECT * FROM transactions'
+        conditions, params = [], []
+        if start:
+            conditions.append('date >= ?')
+            params.append(parse_date(start))
+        if end:
+            conditions.append('date <= ?')
+            params.append(parse_date(end))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
         with self.conn:
-            return self.conn.execute('SELECT * FROM transactions').fetchall()
+            return self.conn.execute(query, params).fetchall()
 
     def delete_transaction(self, trans_id):
         with self.conn:
-            self.conn.execute('DELETE FROM transactions WHERE id = ?', (trans_id,))
+            cursor = self.conn.execute('DELETE FROM transactions WHERE id = ?', (trans_id,))
+        if cursor.rowcount == 0:
+            raise IndexError("Transaction not found")
 
-
-    def __init__(self):
-        self.transactions = []
+    @property
+    def transactions(self):
+        return [Transaction(trans_type, amount, category, date)
+                for _, trans_type, amount, category, date in self.get_transactions()]
 
     def add_income(self, amount, category, date=None):
-        if amount <= 0:
+        if check_cents(amount) <= 0:
             raise ValueError("Income amount must be positive.")
-        self.transactions.append(Transaction("income", amount, category, date))
+        return self.add_transaction("income", amount, category, date)
 
     def add_expense(self, amount, category, date=None):
-        if amount <= 0:
+        if check_cents(amount) <= 0:
             raise ValueError("Expense amount must be positive.")
-        self.transactions.append(Transaction("expense", amount, category, date))
-
-    def delete_transaction(self, index):
-        if 0 <= index < len(self.transactions):
-            del self.transactions[index]
-        else:
-            raise IndexError("Transaction index out of range")
+        return self.add_transaction("expense", amount, category, date)
 
     def view_status(self):
-        total_income = sum(t.amount for t in self.transactions if t.trans_type == "income")
-        total_expense = sum(t.amount for t in self.transactions if t.trans_type == "expense")
+        total_income, total_expense = self.conn.execute(
+            'SELECT income_cents, expense_cents FROM totals WHERE id = 1'
+        ).fetchone()
         balance = total_income - total_expense
         return total_income, total_expense, balance
 
+    def rebuild_totals(self):
+        """Recompute the running totals from scratch.
+
+        Returns the (income, expense) drift that was corrected, as stored
+        minus actual cents.
+        """
+        with self.conn:
+            income, expense = self.conn.execute('''
+                SELECT COALESCE(SUM(CASE trans_type WHEN 'income' THEN amount_cents END), 0),
+                       COALESCE(SUM(CASE trans_type WHEN 'expense' THEN amount_cents END), 0)
+                FROM transactions
+            ''').fetchone()
+            stored = self.conn.execute('SELECT income_cents, expense_cents FROM totals WHERE id = 1').fetchone()
+            self.conn.execute('''
+                INSERT OR REPLACE INTO totals (id, income_cents, expense_cents) VALUES (1, ?, ?)
+            ''', (income, expense))
+        if stored is None:
+            return 0, 0
+        return stored[0] - income, stored[1] - expense
+
     def view_history(self):
-        return [(i, t.date, t.trans_type, t.amount, t.category) for i, t in enumerate(self.transactions)]
+        return [(trans_id, date, trans_type, amount, category)
+                for trans_id, trans_type, amount, category, date in self.get_transactions()]
 
     def save_to_file(self, file_path):
         with open(file_path, "w") as file:
@@ -130,29 +266,36 @@ class Budget:
     def load_from_file(self, file_path):
         try:
             with open(file_path, "r") as file:
-                self.transactions = [Transaction.from_dict(t) for t in json.load(file)]
+                transactions = [Transaction.from_dict(t) for t in json.load(file)]
         except FileNotFoundError:
-            pass
+            return
+        with self.conn:
+            self.conn.execute('DELETE FROM transactions')
+            self.conn.executemany('''
+                INSERT INTO transactions (trans_type, amount_cents, category, date)
+                VALUES (?, ?, ?, ?)
+            ''', [(t.trans_type, t.amount, t.category, t.date) for t in transactions])
+            self.conn.executemany('INSERT OR IGNORE INTO categories (name) VALUES (?)',
+                                  [(t.category,) for t in transactions])
 
     def category_report(self):
-        report = {}
-        for t in self.transactions:
-            if t.trans_type == "expense":
-                if t.category in report:
-                    report[t.category] += t.amount
-                else:
-                    report[t.category] = t.amount
-        return report
-        class Budget:
-    
+        return dict(self.conn.execute('''
+            SELECT category, SUM(total_cents) FROM monthly_rollup
+            WHERE trans_type = 'expense'
+            GROUP BY category
+        '''))
+
+    @property
+    def categories(self):
+        return [name for name, in self.conn.execute('SELECT name FROM categories ORDER BY name')]
 
     def add_category(self, category):
-        if category not in self.categories:
-            self.categories.append(category)
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (category,))
 
     def remove_category(self, category):
-        if category in self.categories:
-            self.categories.remove(category)
+        with self.conn:
+            self.conn.execute('DELETE FROM categories WHERE name = ?', (category,))
 
 
 class BudgetApp:
@@ -235,35 +378,35 @@ class BudgetApp:
 
     def add_income(self):
         try:
-            amount = float(self.amount_entry.get())
+            amount = to_cents(self.amount_entry.get())
             category = self.category_entry.get()
             date = self.date_entry.get() or None
             self.budget.add_income(amount, category, date)
-            self.show_message(f"Added income: ${amount} in {category} category.")
+            self.show_message(f"Added income: ${format_cents(amount)} in {category} category.")
         except ValueError as e:
             messagebox.showerror("Error", str(e))
 
     def add_expense(self):
         try:
-            amount = float(self.amount_entry.get())
+            amount = to_cents(self.amount_entry.get())
             category = self.category_entry.get()
             date = self.date_entry.get() or None
             self.budget.add_expense(amount, category, date)
-            self.show_message(f"Added expense: ${amount} in {category} category.")
+            self.show_message(f"Added expense: ${format_cents(amount)} in {category} category.")
         except ValueError as e:
             messagebox.showerror("Error", str(e))
 
     def view_status(self):
         total_income, total_expense, balance = self.budget.view_status()
-        status_message = f"Total Income: ${total_income}\nTotal Expense: ${total_expense}\nBalance: ${balance}"
+        status_message = f"Total Income: ${format_cents(total_income)}\nTotal Expense: ${format_cents(total_expense)}\nBalance: ${format_cents(balance)}"
         self.show_message(status_message)
 
     def view_history(self):
         history = self.budget.view_history()
         self.transaction_tree.delete(*self.transaction_tree.get_children())
-        for index, date, trans_type, amount, category in history:
-            self.transaction_tree.insert("", "end", iid=index, values=(date, trans_type, amount, category))
-        history_message = "\n".join([f"{date}: {trans_type} - ${amount} ({category})" for _, date, trans_type, amount, category in history])
+        for trans_id, date, trans_type, amount, category in history:
+            self.transaction_tree.insert("", "end", iid=trans_id, values=(date, trans_type, format_cents(amount), category))
+        history_message = "\n".join([f"{date}: {trans_type} - ${format_cents(amount)} ({category})" for _, date, trans_type, amount, category in history])
         self.show_message(history_message)
 
     def view_category_report(self):
@@ -271,7 +414,7 @@ class BudgetApp:
         if not report:
             self.show_message("No expenses to report.")
             return
-        report_message = "\nCategory-wise Expense Report:\n" + "\n".join([f"{category}: ${amount}" for category, amount in report.items()])
+        report_message = "\nCategory-wise Expense Report:\n" + "\n".join([f"{category}: ${format_cents(amount)}" for category, amount in report.items()])
         self.show_message(report_message)
 
     def save_budget(self):
@@ -281,10 +424,10 @@ class BudgetApp:
     def delete_transaction(self):
         try:
             selected_item = self.transaction_tree.selection()[0]
-            index = int(selected_item)
-            self.budget.delete_transaction(index)
+            trans_id = int(selected_item)
+            self.budget.delete_transaction(trans_id)
             self.view_history()
-            self.show_message(f"Deleted transaction at index {index}.")
+            self.show_message(f"Deleted transaction with id {trans_id}.")
         except IndexError as e:
             messagebox.showerror("Error", "No transaction selected.")
 
@@ -4,6 +4,12 @@ from datetime import datetime
 import tkinter as tk
 from tkinter import messagebox, ttk
 
+PAGE_SIZE = 500
+
+# One keep-alive session for every call; ledger pages come back compressed.
+api = requests.Session()
+api.headers['Accept-Encoding'] = 'gzip, deflate'
+
 class BudgetApp:
     def __init__(self, root):
         self.root = root
@@ -22,6 +28,7 @@ class BudgetApp:
         self.setup_buttons()
 
         # Load transactions from the backend
+        self.sync_version = None
         self.load_transactions()
 
     def setup_frames(self):
@@ -84,12 +91,45 @@ class BudgetApp:
         self.delete_button.grid(row=6, column=0, columnspan=2, padx=5, pady=5)
 
     def load_transactions(self):
-        response = requests.get('http://127.0.0.1:5000/transactions')
-        transactions = response.json()
-        for transaction in transactions:
-            self.transaction_tree.insert("", "end", iid=transaction['id'], values=(
-                transaction['date'], transaction['trans_type'], transaction['amount'], transaction['category']
-            ))
+        # Keep the Treeview as a local mirror of the ledger: load it in full
+        # once, then apply only what changed since the version we last saw.
+        if self.sync_version is not None and self.apply_changes():
+            return
+        self.sync_version = api.get('http://127.0.0.1:5000/transactions/changes').json()['version']
+        self.transaction_tree.delete(*self.transaction_tree.get_children())
+        params = {'limit': PAGE_SIZE, 'layout': 'columnar'}
+        while True:
+            page = api.get('http://127.0.0.1:5000/transactions', params=params).json()
+            columns = page['transactions']
+            categories = columns['category']['dictionary']
+            rows = zip(columns['id'], columns['date'], columns['trans_type'], columns['amount'], columns['category']['codes'])
+            for transaction_id, date, trans_type, amount, code in rows:
+                self.transaction_tree.insert("", "end", iid=transaction_id, values=(date, trans_type, amount, categories[code]))
+            if page['next'] is None:
+                break
+            params['after'] = page['next']
+
+    def apply_changes(self):
+        while True:
+            response = api.get('http://127.0.0.1:5000/transactions/changes', params={'since': self.sync_version})
+            if response.status_code == 410:
+                return False
+            delta = response.json()
+            for transaction in delta['upserts']:
+                self.upsert_row(transaction)
+            for transaction_id in delta['deletes']:
+                if self.transaction_tree.exists(transaction_id):
+                    self.transaction_tree.delete(transaction_id)
+            self.sync_version = delta['version']
+            if not delta['more']:
+                return True
+
+    def upsert_row(self, transaction):
+        values = (transaction['date'], transaction['trans_type'], transaction['amount'], transaction['category'])
+        if self.transaction_tree.exists(transaction['id']):
+            self.transaction_tree.item(transaction['id'], values=values)
+        else:
+            self.transaction_tree.insert("", "end", iid=transaction['id'], values=values)
 
     def add_income(self):
         amount = self.amount_entry.get()
@@ -112,12 +152,9 @@ class BudgetApp:
             "category": category,
             "date": date
         }
-        response = requests.post('http://127.0.0.1:5000/transactions', json=data)
+        response = api.post('http://127.0.0.1:5000/transactions', json=data)
         if response.status_code == 201:
-            transaction = response.json()
-            self.transaction_tree.insert("", "end", iid=transaction['id'], values=(
-                transaction['date'], transaction['trans_type'], transaction['amount'], transaction['category']
-            ))
+            self.upsert_row(response.json())
             self.show_message(f"Added income: ${amount} in {category} category.")
         else:
             messagebox.showerror("Error", "Failed to add income.")
@@ -143,37 +180,24 @@ class BudgetApp:
             "category": category,
             "date": date
         }
-        response = requests.post('http://127.0.0.1:5000/transactions', json=data)
+        response = api.post('http://127.0.0.1:5000/transactions', json=data)
         if response.status_code == 201:
-            transaction = response.json()
-            self.transaction_tree.insert("", "end", iid=transaction['id'], values=(
-                transaction['date'], transaction['trans_type'], transaction['amount'], transaction['category']
-            ))
+            self.upsert_row(response.json())
             self.show_message(f"Added expense: ${amount} in {category} category.")
         else:
             messagebox.showerror("Error", "Failed to add expense.")
 
     def view_status(self):
-        total_income = sum(float(self.transaction_tree.item(item, 'values')[2]) for item in self.transaction_tree.get_children() if self.transaction_tree.item(item, 'values')[1] == 'income')
-        total_expense = sum(float(self.transaction_tree.item(item, 'values')[2]) for item in self.transaction_tree.get_children() if self.transaction_tree.item(item, 'values')[1] == 'expense')
-        balance = total_income - total_expense
-        status_message = f"Total Income: ${total_income}\nTotal Expense: ${total_expense}\nBalance: ${balance}"
+        status = api.get('http://127.0.0.1:5000/status').json()
+        status_message = f"Total Income: ${status['total_income']}\nTotal Expense: ${status['total_expense']}\nBalance: ${status['balance']}"
         self.show_message(status_message)
 
     def view_history(self):
         self.load_transactions()
 
     def view_category_report(self):
-        expenses = [self.transaction_tree.item(item, 'values') for item in self.transaction_tree.get_children() if self.transaction_tree.item(item, 'values')[1] == 'expense']
-        report = {}
-        for expense in expenses:
-            category = expense[3]
-            amount = float(expense[2])
-            if category in report:
-                report[category] += amount
-            else:
-                report[category] = amount
-        report_message = "\nCategory-wise Expense Report:\n" + "\n.join([f"{category}: ${amount}" for category, amount in report.items()])
+        report = api.get('http://127.0.0.1:5000/reports/category').json()
+        report_message = "\nCategory-wise Expense Report:\n" + "\n".join([f"{category}: ${amount}" for category, amount in report.items()])
         self.show_message(report_message)
 
     def save_budget(self):
@@ -181,15 +205,18 @@ class BudgetApp:
         self.show_message("Budget saved successfully.")
 
     def delete_transaction(self):
-        try:
-            selected_item = self.transaction_tree.selection()[0]
-            transaction_id = int(selected_item)
-            response = requests.delete(f'http://127.0.0.1:5000/transactions/{transaction_id}')
-            if response.status_code == 204:
-                self.transaction_tree.delete(selected_item)
-                self.show_message(f"Deleted transaction with id {transaction_id}.")
-        except IndexError:
+        selected = self.transaction_tree.selection()
+        if not selected:
             messagebox.showerror("Error", "No transaction selected.")
+            return
+        # Every selected row goes in one request and one commit.
+        operations = [{"op": "delete", "id": int(item)} for item in selected]
+        response = api.post('http://127.0.0.1:5000/batch', json=operations)
+        if response.status_code == 200:
+            self.transaction_tree.delete(*selected)
+            self.show_message(f"Deleted {len(selected)} transaction(s).")
+        else:
+            messagebox.showerror("Error", "Failed to delete transactions.")
 
     def show_message(self, message):
         for widget in self.output_frame.winfo_children():
@@ -1,7 +1,16 @@
+import argparse
 import json
-from datetime import datetime
+import mmap
+import sys
+from datetime import date as Date, datetime
+
+import ledger_format
+from money import format_cents, round_to_cents, to_cents
+
+EXPORT_BLOCK_SIZE = 10000
 
 class Transaction:
+    # amount is always in integer cents.
     def __init__(self, trans_type, amount, category, date=None):
         self.trans_type = trans_type
         self.amount = amount
@@ -11,14 +20,26 @@ class Transaction:
     def to_dict(self):
         return {
             "trans_type": self.trans_type,
-            "amount": self.amount,
+            "amount_cents": self.amount,
             "category": self.category,
             "date": self.date
         }
 
     @staticmethod
     def from_dict(data):
-        return Transaction(data["trans_type"], data["amount"], data["category"], data["date"])
+        if "amount_cents" in data:
+            amount = data["amount_cents"]
+        else:
+            # Files saved before amounts were stored in cents.
+            amount = round_to_cents(data["amount"])
+        return Transaction(data["trans_type"], amount, data["category"], data["date"])
+
+
+def is_iso_date(value):
+    try:
+        return Date.fromisoformat(value).isoformat() == value
+    except (TypeError, ValueError):
+        return False
 
 
 class Budget:
@@ -29,30 +50,36 @@ class Budget:
         if amount <= 0:
             print("Income amount must be positive.")
             return
+        if date and not is_iso_date(date):
+            print(f"Invalid date {date}, expected YYYY-MM-DD.")
+            return
         self.transactions.append(Transaction("income", amount, category, date))
-        print(f"Added income: ${amount} in {category} category on {date if date else datetime.now().strftime('%Y-%m-%d')}")
+        print(f"Added income: ${format_cents(amount)} in {category} category on {date if date else datetime.now().strftime('%Y-%m-%d')}")
 
     def add_expense(self, amount, category, date=None):
         if amount <= 0:
             print("Expense amount must be positive.")
             return
+        if date and not is_iso_date(date):
+            print(f"Invalid date {date}, expected YYYY-MM-DD.")
+            return
         self.transactions.append(Transaction("expense", amount, category, date))
-        print(f"Added expense: ${amount} in {category} category on {date if date else datetime.now().strftime('%Y-%m-%d')}")
+        print(f"Added expense: ${format_cents(amount)} in {category} category on {date if date else datetime.now().strftime('%Y-%m-%d')}")
 
     def view_status(self):
         total_income = sum(t.amount for t in self.transactions if t.trans_type == "income")
         total_expense = sum(t.amount for t in self.transactions if t.trans_type == "expense")
         balance = total_income - total_expense
-        print(f"Total Income: ${total_income}")
-        print(f"Total Expense: ${total_expense}")
-        print(f"Balance: ${balance}")
+        print(f"Total Income: ${format_cents(total_income)}")
+        print(f"Total Expense: ${format_cents(total_expense)}")
+        print(f"Balance: ${format_cents(balance)}")
 
     def view_history(self):
         if not self.transactions:
             print("No transactions available.")
             return
         for t in self.transactions:
-            print(f"{t.date}: {t.trans_type} - ${t.amount} ({t.category})")
+            print(f"{t.date}: {t.trans_type} - ${format_cents(t.amount)} ({t.category})")
 
     def save_to_file(self, file_path):
         with open(file_path, "w") as file:
@@ -67,7 +94,57 @@ class Budget:
         except FileNotFoundError:
             print("File not found. Starting with an empty budget.")
 
+    def export_binary(self, file_path):
+        # Category codes and ids are assigned in order of first appearance.
+        codes = {}
+        records = []
+        for trans_id, t in enumerate(self.transactions, 1):
+            # Older versions stored dates and types unchecked; name the bad
+            # transaction rather than failing somewhere inside the encoder.
+            if not is_iso_date(t.date):
+                raise ValueError(f"Transaction {trans_id} has date {t.date!r}, expected YYYY-MM-DD.")
+            if t.trans_type not in ledger_format.TRANSACTION_TYPES:
+                raise ValueError(f"Transaction {trans_id} has type {t.trans_type!r}, expected income or expense.")
+            records.append((trans_id, Date.fromisoformat(t.date).toordinal(), t.amount,
+                            ledger_format.TRANSACTION_TYPES.index(t.trans_type), codes.setdefault(t.category, len(codes))))
+        blocks = (records[i:i + EXPORT_BLOCK_SIZE] for i in range(0, len(records), EXPORT_BLOCK_SIZE))
+        with open(file_path, "wb") as file:
+            for chunk in ledger_format.encode(list(codes), blocks):
+                file.write(chunk)
+        print(f"Exported {len(records)} transactions to {file_path}")
+
+    def import_binary(self, file_path):
+        with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            with ledger_format.Ledger(view) as ledger:
+                types, categories = ledger_format.TRANSACTION_TYPES, ledger.categories
+                self.transactions = [Transaction(types[trans_type], cents, categories[code], Date.fromordinal(ordinal).isoformat())
+                                     for _, ordinal, cents, trans_type, code in ledger]
+        print(f"Imported {len(self.transactions)} transactions from {file_path}")
+
+def convert(args):
+    budget = Budget()
+    if args.command == "export":
+        budget.load_from_file(args.budget)
+        try:
+            budget.export_binary(args.file)
+        except ValueError as e:
+            sys.exit(f"Export failed: {e} Fix it in {args.budget} and try again.")
+    else:
+        budget.import_binary(args.file)
+        budget.save_to_file(args.budget)
+
 def main():
+    if len(sys.argv) > 1:
+        parser = argparse.ArgumentParser(description="Convert between budget.json and the binary ledger format.")
+        subparsers = parser.add_subparsers(dest="command", required=True)
+        for command, help in (("export", "write the budget to a binary ledger file"),
+                              ("import", "replace the budget with a binary ledger file, e.g. from GET /export?format=bin")):
+            subparser = subparsers.add_parser(command, help=help)
+            subparser.add_argument("file")
+            subparser.add_argument("--budget", default="budget.json")
+        convert(parser.parse_args())
+        return
+
     budget = Budget()
     budget.load_from_file("budget.json")
 
@@ -77,7 +154,7 @@ def main():
 
         if choice == '1':
             try:
-                amount = float(input("Enter income amount: "))
+                amount = to_cents(input("Enter income amount: "))
                 category = input("Enter category: ")
                 date = input("Enter date (YYYY-MM-DD) or leave blank for today: ")
                 budget.add_income(amount, category, date if date else None)
@@ -85,7 +162,7 @@ def main():
                 print("Invalid amount entered. Please enter a numerical value.")
         elif choice == '2':
             try:
-                amount = float(input("Enter expense amount: "))
+                amount = to_cents(input("Enter expense amount: "))
                 category = input("Enter category: ")
                 date = input("Enter date (YYYY-MM-DD) or leave blank for today: ")
                 budget.add_expense(amount, category, date if date else None)
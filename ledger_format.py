@@ -0,0 +1,124 @@
+"""Compact binary ledger format, shared by the API export and commandline.py.
+
+All integers are little-endian. A file is laid out as
+
+    header      magic b'BDGT', format version (u16), record size (u16),
+                category count (u32)
+    dictionary  per category: name length (u16) + UTF-8 name; a record's
+                category code is its position in this list
+    blocks      record count (u32) + that many fixed-width records, repeated;
+                a count of 0 ends the blocks
+    trailer     total record count (u64) + CRC-32 of every byte before it
+
+and each record is id (i64), date as a proleptic Gregorian ordinal (i32),
+amount in cents (i64), type (u8, an index into TRANSACTION_TYPES) and
+category code (u32).
+
+The writer only needs the dictionary up front, so a ledger can be streamed
+out block by block. The reader works on anything supporting the buffer
+protocol -- bytes, a memoryview or an mmap of the file -- and unpacks
+records straight out of it without copying.
+"""
+import struct
+import zlib
+
+MAGIC = b'BDGT'
+VERSION = 1
+TRANSACTION_TYPES = ('income', 'expense')
+
+HEADER = struct.Struct('<4sHHI')
+NAME_LENGTH = struct.Struct('<H')
+BLOCK = struct.Struct('<I')
+RECORD = struct.Struct('<qiqBI')
+TOTAL = struct.Struct('<Q')
+CHECKSUM = struct.Struct('<I')
+
+
+def encode(categories, blocks):
+    """Yield the encoded ledger chunk by chunk.
+
+    `categories` is the list of names that category codes index into;
+    `blocks` is an iterable of record-tuple lists, each written as a block.
+    """
+    crc = 0
+    count = 0
+
+    def emit(data):
+        nonlocal crc
+        crc = zlib.crc32(data, crc)
+        return data
+
+    names = [name.encode() for name in categories]
+    yield emit(HEADER.pack(MAGIC, VERSION, RECORD.size, len(names))
+               + b''.join(NAME_LENGTH.pack(len(name)) + name for name in names))
+    pack = RECORD.pack
+    for records in blocks:
+        if not records:
+            continue
+        count += len(records)
+        yield emit(BLOCK.pack(len(records)) + b''.join([pack(*record) for record in records]))
+    yield emit(BLOCK.pack(0) + TOTAL.pack(count))
+    yield CHECKSUM.pack(crc)
+
+
+class Ledger:
+    """A decoded view over an encoded ledger buffer.
+
+    Construction checks the header and checksum; iterating yields
+    (id, date_ordinal, cents, type, category_code) tuples. Use it as a
+    context manager over an mmap so the map can be closed afterwards.
+    """
+
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer)
+        self._view = self._buffer.cast('B')
+        if len(self._view) < HEADER.size + BLOCK.size + TOTAL.size + CHECKSUM.size:
+            raise ValueError('Truncated ledger')
+        magic, version, record_size, category_count = HEADER.unpack_from(self._view)
+        if magic != MAGIC:
+            raise ValueError('Not a binary ledger')
+        if version != VERSION or record_size != RECORD.size:
+            raise ValueError(f'Unsupported ledger format version {version}')
+        checked = len(self._view) - CHECKSUM.size
+        (crc,) = CHECKSUM.unpack_from(self._view, checked)
+        if zlib.crc32(self._view[:checked]) != crc:
+            raise ValueError('Ledger checksum mismatch')
+        (self.count,) = TOTAL.unpack_from(self._view, checked - TOTAL.size)
+
+        offset = HEADER.size
+        self.categories = []
+        for _ in range(category_count):
+            (length,) = NAME_LENGTH.unpack_from(self._view, offset)
+            offset += NAME_LENGTH.size
+            self.categories.append(str(self._view[offset:offset + length], 'utf-8'))
+            offset += length
+        self._blocks_offset = offset
+
+    def blocks(self):
+        """Yield a memoryview over the records of each block."""
+        offset = self._blocks_offset
+        while True:
+            (count,) = BLOCK.unpack_from(self._view, offset)
+            offset += BLOCK.size
+            if count == 0:
+                return
+            end = offset + count * RECORD.size
+            yield self._view[offset:end]
+            offset = end
+
+    def __iter__(self):
+        for block in self.blocks():
+            yield from RECORD.iter_unpack(block)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._view.release()
+        self._buffer.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,32 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+
+# The largest single amount, in cents. SQLite sums integers in 64 bits and
+# quietly switches to floating point past that, so the cap is set well
+# below 2**63 to keep the totals of any realistic ledger exact.
+MAX_CENTS = 10 ** 13
+
+def to_cents(amount):
+    try:
+        cents = Decimal(str(amount)) * 100
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {amount}")
+    if not cents.is_finite() or cents != cents.to_integral_value():
+        raise ValueError("Amount can't have more than two decimal places.")
+    if abs(cents) > MAX_CENTS:
+        raise ValueError(f"Amount can't be more than {format_cents(MAX_CENTS)}.")
+    return int(cents)
+
+def round_to_cents(amount):
+    # For amounts saved as floats before cents were stored: those files can
+    # hold float noise (0.30000000000000004) or more than two decimals typed
+    # into the old CLI, so round to the nearest cent instead of rejecting.
+    try:
+        return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid amount: {amount}")
+
+def format_cents(cents):
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
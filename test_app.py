@@ -0,0 +1,1199 @@
+import base64
+import contextlib
+import gzip
+import io
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+from datetime import date
+from unittest import mock
+
+DB_DIR = tempfile.mkdtemp()
+os.environ['BUDGET_SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(DB_DIR, 'test_budget.db')
+
+import ledger_format
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db, init_db, ImportJob, rebuild_totals, checkpoint_wal, analyze_ledger, report_cache, WriteBehindQueue
+
+
+@contextlib.contextmanager
+def captured_statements():
+    """Collect (statement, parameters) for every statement that touches the ledger table."""
+    statements = []
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if '"transaction"' in statement:
+            statements.append((statement, parameters))
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+def query_plan(statement, parameters):
+    with app.app_context(), db.engine.connect() as connection:
+        return [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+
+class APITestCase(unittest.TestCase):
+    def setUp(self):
+        with app.app_context():
+            db.drop_all()
+            init_db()
+        self.client = app.test_client()
+
+    def add(self, trans_type, amount, category, date):
+        response = self.client.post('/transactions', json={
+            "trans_type": trans_type,
+            "amount": amount,
+            "category": category,
+            "date": date
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json
+
+
+class TestTransactionsAPI(APITestCase):
+    def test_add_and_list(self):
+        created = self.add("income", 1000, "Salary", "2024-07-24")
+        self.assertEqual(self.client.get('/transactions').json, [created])
+
+    def test_amounts_capped_so_totals_stay_exact(self):
+        for _ in range(2):
+            response = self.client.post('/transactions', json={"trans_type": "income", "amount": 9e16, "category": "Misc", "date": "2024-07-24"})
+            self.assertEqual(response.status_code, 400)
+        self.add("income", 10 ** 11, "Misc", "2024-07-24")
+        self.add("income", 10 ** 11, "Misc", "2024-07-25")
+        self.assertEqual(self.client.get('/status').json['total_income'], 2 * 10 ** 11)
+        self.assertEqual(self.client.get('/transactions?min=9e16').status_code, 400)
+
+    def test_add_rejects_invalid(self):
+        response = self.client.post('/transactions', json={"trans_type": "gift", "amount": 5, "category": "Misc", "date": "2024-07-24"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/transactions', json={"trans_type": "income", "amount": -5, "category": "Misc", "date": "2024-07-24"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_amounts_are_exact(self):
+        for amount in (0.1, 0.2, 0.3):
+            self.add("expense", amount, "Coffee", "2024-07-24")
+        self.assertEqual(self.client.get('/status').json["total_expense"], 0.6)
+        response = self.client.post('/transactions', json={"trans_type": "expense", "amount": 0.001, "category": "Coffee", "date": "2024-07-24"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_add_rejects_invalid_date(self):
+        response = self.client.post('/transactions', json={"trans_type": "expense", "amount": 5, "category": "Misc", "date": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_date_range(self):
+        for date in ("2024-06-30", "2024-07-01", "2024-07-15", "2024-07-31", "2024-08-01"):
+            self.add("expense", 10, "Groceries", date)
+        july = self.client.get('/transactions?from=2024-07-01&to=2024-07-31').json
+        self.assertEqual(sorted(t['date'] for t in july), ["2024-07-01", "2024-07-15", "2024-07-31"])
+        page = self.client.get('/transactions?from=2024-07-10&limit=10').json
+        self.assertEqual([t['date'] for t in page['transactions']], ["2024-07-15", "2024-07-31", "2024-08-01"])
+        self.assertEqual(self.client.get('/status?to=2024-07-01').json["total_expense"], 20)
+        self.assertEqual(self.client.get('/transactions?from=July').status_code, 400)
+
+    def test_delete(self):
+        created = self.add("expense", 50, "Groceries", "2024-07-24")
+        self.assertEqual(self.client.delete(f"/transactions/{created['id']}").status_code, 204)
+        self.assertEqual(self.client.delete(f"/transactions/{created['id']}").status_code, 404)
+
+
+class TestPagination(APITestCase):
+    def test_walk_pages_in_date_order(self):
+        dates = ["2024-07-03", "2024-07-01", "2024-07-02", "2024-07-01", "2024-07-05"]
+        for date in dates:
+            self.add("expense", 10, "Groceries", date)
+
+        seen = []
+        params = {'limit': 2}
+        while True:
+            page = self.client.get('/transactions', query_string=params).json
+            self.assertLessEqual(len(page['transactions']), 2)
+            seen.extend((t['date'], t['id']) for t in page['transactions'])
+            if page['next'] is None:
+                break
+            params['after'] = page['next']
+
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(seen), len(dates))
+
+    def test_limit_is_capped(self):
+        for _ in range(3):
+            self.add("expense", 10, "Groceries", "2024-07-01")
+        app.config['MAX_PAGE_SIZE'] = 2
+        try:
+            page = self.client.get('/transactions?limit=50').json
+        finally:
+            app.config['MAX_PAGE_SIZE'] = 1000
+        self.assertEqual(len(page['transactions']), 2)
+        self.assertIsNotNone(page['next'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/transactions?after=not-a-cursor').status_code, 400)
+        forged = base64.urlsafe_b64encode(json.dumps(["2024-01-01", 2 ** 70]).encode()).decode()
+        response = self.client.get('/transactions', query_string={'after': forged})
+        self.assertEqual((response.status_code, response.json), (400, {'error': 'Invalid cursor'}))
+        self.assertEqual(self.client.get('/transactions?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/transactions?limit=abc').status_code, 400)
+
+
+class TestFilters(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.rows = [
+            self.add("income", 1000, "Salary", "2024-07-01"),
+            self.add("expense", 12.5, "Groceries", "2024-07-02"),
+            self.add("expense", 80, "Rent", "2024-07-02"),
+            self.add("expense", 45, "Groceries", "2024-08-01"),
+            self.add("income", 50, "Gifts", "2024-08-03"),
+        ]
+
+    def ids(self, query):
+        response = self.client.get('/transactions?' + query)
+        self.assertEqual(response.status_code, 200)
+        return [t['id'] for t in response.json]
+
+    def test_filters(self):
+        self.assertEqual(self.ids('sort=id&type=income'), [1, 5])
+        self.assertEqual(self.ids('sort=id&category=Groceries&category=Rent'), [2, 3, 4])
+        self.assertEqual(self.ids('category=Nowhere'), [])
+        self.assertEqual(self.ids('sort=id&min=45&max=80'), [3, 4, 5])
+        self.assertEqual(self.ids('type=expense&category=Groceries&to=2024-07-31'), [2])
+
+    def test_sort(self):
+        self.assertEqual(self.ids('sort=-id'), [5, 4, 3, 2, 1])
+        self.assertEqual(self.ids('sort=-date'), [5, 4, 3, 2, 1])
+        self.assertEqual(self.ids('sort=date&type=expense'), [2, 3, 4])
+
+    def test_pages_follow_sort(self):
+        seen = []
+        params = {'limit': 2, 'sort': '-date', 'type': 'expense'}
+        while True:
+            page = self.client.get('/transactions', query_string=params).json
+            seen.extend(t['id'] for t in page['transactions'])
+            if page['next'] is None:
+                break
+            params['after'] = page['next']
+        self.assertEqual(seen, [4, 3, 2])
+
+    def test_filters_apply_to_ndjson(self):
+        body = self.client.get('/transactions?format=ndjson&category=Gifts&sort=-id').get_data(as_text=True)
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [self.rows[4]])
+
+    def test_invalid_parameters(self):
+        for query in ('type=gift', 'min=abc', 'max=0.001', 'sort=amount', 'sort=category'):
+            response = self.client.get('/transactions?' + query)
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_plans_use_indexes(self):
+        transactions = [
+            {"trans_type": ("income", "expense")[i % 2], "amount": i % 500 + 1,
+             "category": f"Category {i % 5}", "date": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}"}
+            for i in range(2000)
+        ]
+        self.client.post('/transactions/batch', json=transactions)
+        with app.app_context():
+            analyze_ledger()
+
+        # Selective filters must be answered by an index search; sorted pages
+        # must come off an index in order so LIMIT stops the walk early.
+        searches = [
+            'from=2024-03-01&to=2024-03-31', 'category=Category 1',
+            'category=Category 1&category=Category 2', 'min=10&max=20',
+            'type=expense&category=Category 1&min=10', 'category=Category 1&from=2024-03-01',
+        ]
+        pages = [
+            'limit=10', 'limit=10&sort=-date', 'limit=10&sort=id', 'limit=10&sort=-id',
+            'limit=10&type=expense', 'limit=10&category=Category 1&sort=-date',
+            'limit=10&category=Category 1&category=Category 2',
+            'format=ndjson&type=income',
+        ]
+        with captured_statements() as statements:
+            for query in searches + pages:
+                self.client.get('/transactions?' + query).get_data()
+        plans = [query_plan(statement, parameters) for statement, parameters in statements]
+        self.assertEqual(len(plans), len(searches) + len(pages))
+        for query, plan in zip(searches, plans):
+            self.assertTrue(plan[0].startswith('SEARCH transaction USING'), (query, plan))
+        for query, plan in zip(pages, plans[len(searches):]):
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, query)
+
+
+class TestFieldProjection(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.add("income", 1000, "Salary", "2024-07-01")
+        self.add("expense", 12.5, "Groceries", "2024-07-02")
+        self.add("expense", 80, "Rent", "2024-07-03")
+
+    def test_rows(self):
+        response = self.client.get('/transactions?fields=date,amount&sort=id')
+        self.assertEqual(response.json, [
+            {"date": "2024-07-01", "amount": 1000},
+            {"date": "2024-07-02", "amount": 12.5},
+            {"date": "2024-07-03", "amount": 80},
+        ])
+
+    def test_columnar(self):
+        response = self.client.get('/transactions?fields=category,amount&layout=columnar&sort=id')
+        self.assertEqual(response.json, {
+            "category": {"dictionary": ["Salary", "Groceries", "Rent"], "codes": [0, 1, 2]},
+            "amount": [1000, 12.5, 80],
+        })
+
+    def test_pages_without_cursor_fields(self):
+        seen = []
+        params = {'limit': 2, 'fields': 'amount'}
+        while True:
+            page = self.client.get('/transactions', query_string=params).json
+            seen.extend(page['transactions'])
+            if page['next'] is None:
+                break
+            params['after'] = page['next']
+        self.assertEqual(seen, [{"amount": 1000}, {"amount": 12.5}, {"amount": 80}])
+
+    def test_ndjson(self):
+        body = self.client.get('/transactions?format=ndjson&fields=id,trans_type').get_data(as_text=True)
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [
+            {"id": 1, "trans_type": "income"}, {"id": 2, "trans_type": "expense"}, {"id": 3, "trans_type": "expense"},
+        ])
+
+    def test_invalid_fields(self):
+        for fields in ('', 'amount_cents', 'date,,amount'):
+            self.assertEqual(self.client.get('/transactions', query_string={'fields': fields}).status_code, 400)
+
+    def test_chart_query_is_index_only(self):
+        with captured_statements() as statements:
+            self.client.get('/transactions?fields=date,amount&from=2024-07-01&to=2024-07-31&limit=10')
+        (statement, parameters), = statements
+        self.assertEqual(query_plan(statement, parameters), ['SEARCH transaction USING COVERING INDEX ix_transaction_date_id_amount (date>? AND date<?)'])
+
+
+class TestCounts(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.add("income", 1000, "Salary", "2024-06-28")
+        self.add("expense", 12.5, "Groceries", "2024-07-02")
+        self.add("expense", 80, "Rent", "2024-07-03")
+        self.add("expense", 45, "Groceries", "2024-07-20")
+        self.add("income", 50, "Gifts", "2024-08-03")
+        self.client.delete('/transactions/3')
+
+    def test_matches_listing(self):
+        queries = [
+            '', 'type=expense', 'category=Groceries&category=Gifts', 'category=Nowhere',
+            'from=2024-07-01&to=2024-07-31', 'from=2024-07-03&to=2024-08-31', 'type=expense&to=2024-07-10',
+            'min=45', 'min=40&max=60&type=expense',
+        ]
+        for query in queries:
+            expected = len(self.client.get('/transactions?' + query).json)
+            response = self.client.get('/transactions/count?' + query)
+            self.assertEqual(response.json, {"count": expected}, query)
+            self.assertEqual(response.headers['X-Total-Count'], str(expected), query)
+
+    def test_head(self):
+        with captured_statements() as statements:
+            response = self.client.head('/transactions?type=income&from=2024-06-01&to=2024-08-31')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Total-Count'], '2')
+        self.assertEqual(response.data, b'')
+        # Whole months are counted from the rollup alone.
+        self.assertEqual(statements, [])
+
+        cached = self.client.head('/transactions', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+
+    def test_follows_writes(self):
+        self.assertEqual(self.client.get('/transactions/count').json, {"count": 4})
+        self.add("expense", 5, "Coffee", "2024-09-01")
+        self.client.delete('/transactions/1')
+        self.assertEqual(self.client.head('/transactions').headers['X-Total-Count'], '4')
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.client.get('/transactions/count?type=gift').status_code, 400)
+        self.assertEqual(self.client.head('/transactions?min=abc').status_code, 400)
+
+
+class TestNDJSONExport(APITestCase):
+    def test_format_parameter(self):
+        created = [self.add("expense", i, "Groceries", "2024-07-01") for i in range(1, 4)]
+        app.config['STREAM_BATCH_SIZE'] = 2
+        try:
+            response = self.client.get('/transactions?format=ndjson')
+            body = response.get_data(as_text=True)
+        finally:
+            app.config['STREAM_BATCH_SIZE'] = 1000
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], created)
+
+    def test_accept_header(self):
+        created = self.add("income", 1000, "Salary", "2024-07-24")
+        response = self.client.get('/transactions', headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(json.loads(response.get_data(as_text=True)), created)
+
+    def test_rejects_paging(self):
+        self.add("income", 1000, "Salary", "2024-07-24")
+        self.add("expense", 20, "Groceries", "2024-07-25")
+        cursor = self.client.get('/transactions?limit=1').json['next']
+        for query in ('limit=1', f'after={cursor}', f'limit=1&after={cursor}'):
+            response = self.client.get(f'/transactions?format=ndjson&{query}')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('limit and after', response.json['error'])
+
+
+class TestFastReadPath(APITestCase):
+    def test_matches_orm_path(self):
+        for i in range(1, 6):
+            self.add("income" if i % 2 else "expense", i + 0.25, f"Category {i % 2}", f"2024-07-0{i}")
+        self.client.delete('/transactions/2')
+        paths = ['/transactions', '/transactions?format=ndjson', '/transactions?limit=2',
+                 '/transactions?from=2024-07-03', '/transactions/changes?since=0']
+        fast = [self.client.get(path).data for path in paths]
+        app.config['FAST_READ_ENDPOINTS'] = []
+        try:
+            orm = [self.client.get(path).data for path in paths]
+        finally:
+            app.config['FAST_READ_ENDPOINTS'] = ['get_transactions', 'get_changes']
+        self.assertEqual(fast, orm)
+
+
+class TestBinaryExport(APITestCase):
+    def test_round_trip(self):
+        self.add("income", 1000, "Salary", "2024-07-01")
+        self.add("expense", 20.5, "Groceries", "0001-01-01")
+        self.add("expense", 30, "Groceries", "9999-12-31")
+        app.config['STREAM_BATCH_SIZE'] = 2
+        try:
+            response = self.client.get('/export?format=bin')
+            data = response.get_data()
+        finally:
+            app.config['STREAM_BATCH_SIZE'] = 1000
+        self.assertEqual(response.mimetype, 'application/octet-stream')
+        ledger = ledger_format.Ledger(data)
+        self.assertEqual(ledger.categories, ["Salary", "Groceries"])
+        self.assertEqual(len(ledger), 3)
+        self.assertEqual(len(list(ledger.blocks())), 2)
+        decoded = [{
+            'id': id,
+            'trans_type': ledger_format.TRANSACTION_TYPES[trans_type],
+            'amount': cents / 100,
+            'category': ledger.categories[code],
+            'date': date.fromordinal(ordinal).isoformat()
+        } for id, ordinal, cents, trans_type, code in ledger]
+        self.assertEqual(decoded, self.client.get('/transactions').json)
+
+    def test_consistent_while_writes_land(self):
+        self.add("income", 1000, "Salary", "2024-07-01")
+        self.add("expense", 20.5, "Groceries", "2024-07-02")
+        app.config['STREAM_BATCH_SIZE'] = 1
+        try:
+            response = self.client.get('/export?format=bin', buffered=False)
+            chunks = response.iter_encoded()
+            data = next(chunks)
+            # Another request, on its own thread so it gets its own session.
+            writer = threading.Thread(target=self.add, args=("expense", 5, "Coffee", "2024-07-03"))
+            writer.start()
+            writer.join()
+            data += b''.join(chunks)
+            response.close()
+        finally:
+            app.config['STREAM_BATCH_SIZE'] = 1000
+        ledger = ledger_format.Ledger(data)
+        self.assertEqual(ledger.categories, ["Salary", "Groceries"])
+        self.assertEqual([id for id, *_ in ledger], [1, 2])
+        self.assertEqual(len(self.client.get('/transactions').json), 3)
+
+    def test_corruption_detected(self):
+        self.add("expense", 20.5, "Groceries", "2024-07-01")
+        data = bytearray(self.client.get('/export?format=bin').data)
+        data[-10] ^= 1
+        with self.assertRaises(ValueError):
+            ledger_format.Ledger(data)
+        self.assertEqual(self.client.get('/export?format=csv').status_code, 400)
+
+
+class TestColumnarLayout(APITestCase):
+    def test_columnar(self):
+        self.add("income", 1000, "Salary", "2024-07-01")
+        self.add("expense", 20.5, "Groceries", "2024-07-02")
+        self.add("expense", 30, "Groceries", "2024-07-03")
+        self.assertEqual(self.client.get('/transactions?layout=columnar').json, {
+            "id": [1, 2, 3],
+            "trans_type": ["income", "expense", "expense"],
+            "amount": [1000, 20.5, 30],
+            "category": {"dictionary": ["Salary", "Groceries"], "codes": [0, 1, 1]},
+            "date": ["2024-07-01", "2024-07-02", "2024-07-03"]
+        })
+        page = self.client.get('/transactions?layout=columnar&limit=2').json
+        self.assertEqual(page['transactions']['id'], [1, 2])
+        self.assertIsNotNone(page['next'])
+
+    def test_invalid_layout(self):
+        self.assertEqual(self.client.get('/transactions?layout=grid').status_code, 400)
+        self.assertEqual(self.client.get('/transactions?layout=columnar&format=ndjson').status_code, 400)
+
+
+class TestCompression(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post('/transactions/batch', json=[
+            {"trans_type": "expense", "amount": i, "category": "Groceries", "date": "2024-07-01"} for i in range(1, 101)
+        ])
+        self.expected = self.client.get('/transactions').json
+
+    def test_gzip_and_deflate(self):
+        response = self.client.get('/transactions', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.data)), self.expected)
+        response = self.client.get('/transactions', headers={'Accept-Encoding': 'deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(json.loads(zlib.decompress(response.data)), self.expected)
+
+    def test_small_responses_left_alone(self):
+        response = self.client.get('/status', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.json['total_expense'], 5050)
+
+    def test_streamed_ndjson(self):
+        app.config['STREAM_BATCH_SIZE'] = 30
+        try:
+            response = self.client.get('/transactions?format=ndjson', headers={'Accept-Encoding': 'gzip'})
+            body = gzip.decompress(response.data).decode()
+        finally:
+            app.config['STREAM_BATCH_SIZE'] = 1000
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], self.expected)
+
+    def test_etag_per_encoding(self):
+        plain = self.client.get('/transactions').headers['ETag']
+        gzipped = self.client.get('/transactions', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        self.assertNotEqual(plain, gzipped)
+        again = self.client.get('/transactions', headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzipped})
+        self.assertEqual(again.status_code, 304)
+
+
+class TestBatchInsert(APITestCase):
+    def test_batch_returns_ids_in_order(self):
+        batch = [
+            {"trans_type": "income", "amount": 1000, "category": "Salary", "date": "2024-07-24"},
+            {"trans_type": "expense", "amount": 200, "category": "Groceries", "date": "2024-07-25"},
+            {"trans_type": "expense", "amount": 30.5, "category": "Fuel", "date": "2024-07-26"},
+        ]
+        app.config['BATCH_CHUNK_SIZE'] = 2
+        try:
+            response = self.client.post('/transactions/batch', json=batch)
+        finally:
+            app.config['BATCH_CHUNK_SIZE'] = 50000
+        self.assertEqual(response.status_code, 201)
+        ids = response.json['ids']
+        self.assertEqual(len(ids), 3)
+        stored = {t['id']: t for t in self.client.get('/transactions').json}
+        for transaction_id, expected in zip(ids, batch):
+            self.assertEqual(stored[transaction_id], dict(expected, id=transaction_id))
+
+    def test_batch_is_validated_up_front(self):
+        batch = [
+            {"trans_type": "income", "amount": 1000, "category": "Salary", "date": "2024-07-24"},
+            {"trans_type": "expense", "category": "Groceries", "date": "2024-07-25"},
+        ]
+        response = self.client.post('/transactions/batch', json=batch)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Transaction 1', response.json['error'])
+        self.assertEqual(self.client.get('/transactions').json, [])
+
+
+class TestBulkWrites(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.add("income", 1000, "Salary", "2024-06-28")
+        self.add("expense", 12.5, "Grocery", "2024-07-02")
+        self.add("expense", 80, "Rent", "2024-07-03")
+        self.add("expense", 45, "Grocery", "2024-07-20")
+        self.add("expense", 50, "Gifts", "2024-08-03")
+
+    def assertConsistent(self):
+        with app.app_context():
+            self.assertEqual(rebuild_totals(), {'income_cents': 0, 'expense_cents': 0})
+            with db.engine.connect() as connection:
+                rollup = connection.exec_driver_sql(
+                    'SELECT month, category_id, trans_type, total_cents, count FROM monthly_rollup ORDER BY 1, 2, 3').all()
+                expected = connection.exec_driver_sql(
+                    "SELECT strftime('%Y-%m-01', date), category_id, trans_type, sum(amount_cents), count(*) "
+                    'FROM "transaction" GROUP BY 1, 2, 3 ORDER BY 1, 2, 3').all()
+        self.assertEqual(rollup, expected)
+
+    def test_delete_by_ids(self):
+        response = self.client.delete('/transactions', json={"ids": [2, 4, 99]})
+        self.assertEqual(response.json, {"deleted": 2})
+        self.assertEqual([t['id'] for t in self.client.get('/transactions?sort=id').json], [1, 3, 5])
+        self.assertEqual(self.client.get('/transactions/changes?since=5').json['deletes'], [2, 4])
+        self.assertConsistent()
+
+    def test_delete_by_filter(self):
+        response = self.client.delete('/transactions?type=expense&from=2024-07-01&to=2024-07-31&min=40')
+        self.assertEqual(response.json, {"deleted": 2})
+        self.assertEqual(self.client.get('/status').json['total_expense'], 62.5)
+        self.assertConsistent()
+
+    def test_delete_many_ids_in_one_statement(self):
+        response = self.client.delete('/transactions', json={"ids": list(range(3, 40000))})
+        self.assertEqual(response.json, {"deleted": 3})
+        self.assertConsistent()
+
+    def test_rename_category(self):
+        response = self.client.patch('/transactions?category=Grocery', json={"set": {"category": "Groceries"}})
+        self.assertEqual(response.json, {"updated": 2})
+        self.assertEqual(self.client.get('/reports/category').json, {"Groceries": 57.5, "Rent": 80, "Gifts": 50})
+        response = self.client.patch('/transactions?category=Groceries', json={"set": {"category": "Groceries"}})
+        self.assertEqual(response.json, {"updated": 0})
+        self.assertConsistent()
+
+    def test_update_moves_between_months_and_types(self):
+        response = self.client.patch('/transactions', json={"ids": [1, 3], "set": {"date": "2024-08-15", "trans_type": "expense"}})
+        self.assertEqual(response.json, {"updated": 2})
+        report = self.client.get('/reports/category?from=2024-08-01&to=2024-08-31').json
+        self.assertEqual(report, {"Salary": 1000, "Rent": 80, "Gifts": 50})
+        self.assertEqual(self.client.get('/status').json['total_income'], 0)
+        self.assertConsistent()
+
+    def test_rejects_invalid_requests(self):
+        self.assertEqual(self.client.delete('/transactions').status_code, 400)
+        self.assertEqual(self.client.delete('/transactions', json={"ids": "1,2"}).status_code, 400)
+        self.assertEqual(self.client.delete('/transactions?type=gift').status_code, 400)
+        self.assertEqual(self.client.patch('/transactions', json={"set": {"category": "X"}}).status_code, 400)
+        self.assertEqual(self.client.patch('/transactions?type=income', json={"set": {"id": 7}}).status_code, 400)
+        self.assertEqual(self.client.patch('/transactions?type=income', json={"set": {"amount": -1}}).status_code, 400)
+        self.assertEqual(self.client.patch('/transactions?type=income', json={"set": {}}).status_code, 400)
+        self.assertEqual(len(self.client.get('/transactions').json), 5)
+
+class TestMixedBatch(APITestCase):
+    def test_operations_apply_in_order(self):
+        salary = self.add("income", 1000, "Salary", "2024-07-01")
+        rent = self.add("expense", 80, "Rent", "2024-07-03")
+        response = self.client.post('/batch', json=[
+            {"op": "create", "transaction": {"trans_type": "expense", "amount": 12.5, "category": "Groceries", "date": "2024-07-02"}},
+            {"op": "update", "id": rent['id'], "set": {"amount": 85, "category": "Housing"}},
+            {"op": "delete", "id": salary['id']},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {"results": [
+            {"status": 201, "transaction": {"id": 3, "trans_type": "expense", "amount": 12.5, "category": "Groceries", "date": "2024-07-02"}},
+            {"status": 200, "transaction": {"id": 2, "trans_type": "expense", "amount": 85, "category": "Housing", "date": "2024-07-03"}},
+            {"status": 204},
+        ]})
+        self.assertEqual(self.client.get('/status').json, {"total_income": 0, "total_expense": 97.5, "balance": -97.5})
+        self.assertEqual(self.client.get('/reports/category').json, {"Housing": 85, "Groceries": 12.5})
+
+    def test_failure_rolls_back_everything(self):
+        created = self.add("income", 1000, "Salary", "2024-07-01")
+        version = self.client.get('/transactions/changes').json['version']
+        response = self.client.post('/batch', json=[
+            {"op": "create", "transaction": {"trans_type": "expense", "amount": 5, "category": "Coffee", "date": "2024-07-02"}},
+            {"op": "delete", "id": created['id']},
+            {"op": "update", "id": 99, "set": {"amount": 1}},
+        ])
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('Operation 2', response.json['error'])
+        self.assertEqual(self.client.get('/transactions').json, [created])
+        self.assertEqual(self.client.get('/transactions/changes').json['version'], version)
+        self.assertEqual(self.client.get('/status').json['total_income'], 1000)
+
+    def test_rejects_invalid_operations(self):
+        for operations in (
+            {"op": "create"},
+            [{"op": "upsert", "id": 1}],
+            [{"op": "delete", "id": "1"}],
+            [{"op": "delete", "id": 2 ** 70}],
+            [{"op": "create", "transaction": {"trans_type": "gift", "amount": 5, "category": "Misc", "date": "2024-07-01"}}],
+            [{"op": "update", "id": 1, "set": {"id": 2}}],
+        ):
+            self.assertEqual(self.client.post('/batch', json=operations).status_code, 400)
+        response = self.client.post('/batch', json=[{"op": "delete", "id": 1}, {"op": "delete", "id": -2 ** 63 - 1}])
+        self.assertEqual(response.json, {'error': 'Operation 1: id must be an integer'})
+
+class TestStreamingImport(APITestCase):
+    def setUp(self):
+        super().setUp()
+        app.config['IMPORT_CHUNK_SIZE'] = 2
+
+    def tearDown(self):
+        app.config['IMPORT_CHUNK_SIZE'] = 10000
+
+    def start(self, import_format='jsonl'):
+        response = self.client.post('/imports', query_string={'format': import_format})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.headers['Location'], f"/imports/{response.json['id']}")
+        return response.json['id']
+
+    def jsonl(self, count, start=1):
+        return b''.join(
+            json.dumps({"trans_type": "expense", "amount": i, "category": "Imported", "date": "2024-07-01"}).encode() + b'\n'
+            for i in range(start, start + count)
+        )
+
+    def test_jsonl(self):
+        job_id = self.start()
+        body = self.jsonl(5) + b'\n'
+        response = self.client.put(f'/imports/{job_id}', data=body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {
+            "id": job_id, "format": "jsonl", "status": "complete", "offset": len(body), "lines": 6, "rows": 5, "error": None
+        })
+        self.assertEqual(self.client.get(f'/imports/{job_id}').json, response.json)
+        self.assertEqual(self.client.get('/status').json['total_expense'], 15)
+        with app.app_context():
+            self.assertEqual(rebuild_totals(), {'income_cents': 0, 'expense_cents': 0})
+
+    def test_csv(self):
+        job_id = self.start('csv')
+        body = ('﻿date,trans_type,amount,category,note\r\n'
+                '2024-07-01,income,1000,Salary,\r\n'
+                '2024-07-02,expense,12.50,"Food, drink","two\r\nlines"\r\n').encode()
+        response = self.client.put(f'/imports/{job_id}', data=body)
+        self.assertEqual(response.json['status'], 'complete')
+        self.assertEqual(response.json['rows'], 2)
+        self.assertEqual(self.client.get('/reports/category').json, {"Food, drink": 12.5})
+
+    def test_resume_after_invalid_line(self):
+        job_id = self.start()
+        lines = self.jsonl(5).splitlines(keepends=True)
+        lines[3] = b'{"trans_type": "expense", "amount": "four"}\n'
+        response = self.client.put(f'/imports/{job_id}', data=b''.join(lines))
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json['error'].startswith('Line 4: '))
+        job = self.client.get(f'/imports/{job_id}').json
+        self.assertEqual((job['status'], job['rows'], job['offset']), ('failed', 2, len(lines[0] + lines[1])))
+        self.assertEqual(len(self.client.get('/transactions').json), 2)
+
+        lines[3] = self.jsonl(1, start=4)
+        rest = b''.join(lines)[job['offset']:]
+        self.assertEqual(self.client.put(f'/imports/{job_id}', data=rest).status_code, 409)
+        response = self.client.put(f'/imports/{job_id}?offset={job["offset"]}', data=rest)
+        self.assertEqual(response.json['status'], 'complete')
+        amounts = [t['amount'] for t in self.client.get('/transactions?sort=id').json]
+        self.assertEqual(amounts, [1, 2, 3, 4, 5])
+        self.assertEqual(self.client.put(f'/imports/{job_id}?offset={len(b"".join(lines))}', data=b'').status_code, 409)
+
+    def test_resume_after_disconnect(self):
+        job_id = self.start('csv')
+        body = b'trans_type,amount,category,date\n' + b''.join(
+            f'expense,{i},Imported,2024-07-0{i}\n'.encode() for i in range(1, 8)
+        )
+        # The body ends short of its Content-Length, as when a client drops.
+        with mock.patch('app.IMPORT_READ_SIZE', 16):
+            self.client.put(f'/imports/{job_id}', input_stream=io.BytesIO(body[:-10]),
+                            environ_overrides={'CONTENT_LENGTH': str(len(body))})
+        job = self.client.get(f'/imports/{job_id}').json
+        # Every complete chunk before the cut-off last row was kept.
+        self.assertEqual((job['status'], job['lines'], job['rows']), ('interrupted', 7, 6))
+
+        response = self.client.put(f'/imports/{job_id}?offset={job["offset"]}', data=body[job['offset']:])
+        self.assertEqual(response.json['rows'], 7)
+        self.assertEqual(len(self.client.get('/transactions').json), 7)
+
+    def test_restart_releases_running_jobs(self):
+        job_id = self.start()
+        with app.app_context():
+            db.session.execute(update(ImportJob).values(status='running'))
+            db.session.commit()
+            self.assertEqual(self.client.put(f'/imports/{job_id}', data=self.jsonl(1)).status_code, 409)
+            init_db()
+        self.assertEqual(self.client.get(f'/imports/{job_id}').json['status'], 'interrupted')
+        self.assertEqual(self.client.put(f'/imports/{job_id}', data=self.jsonl(1)).status_code, 200)
+
+    def test_rejects_invalid_requests(self):
+        self.assertEqual(self.client.post('/imports?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/imports/99').status_code, 404)
+        self.assertEqual(self.client.put('/imports/99', data=b'').status_code, 404)
+        job_id = self.start('csv')
+        response = self.client.put(f'/imports/{job_id}', data=b'date,amount\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('trans_type', response.json['error'])
+        job_id = self.start('csv')
+        oversized = b'expense,1,' + b'x' * 200000 + b',2024-07-01\n'
+        response = self.client.put(f'/imports/{job_id}', data=b'trans_type,amount,category,date\n' + oversized)
+        self.assertEqual(response.json['error'], 'Line 2: malformed CSV: field larger than field limit (131072)')
+
+class TestWriteBehind(APITestCase):
+    def setUp(self):
+        super().setUp()
+        app.config['WRITE_BEHIND'] = True
+        self.queue = WriteBehindQueue()
+        patcher = mock.patch('app.write_behind', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(app.config.update, WRITE_BEHIND=False, WRITE_BEHIND_QUEUE_SIZE=10000)
+
+    def test_concurrent_posts(self):
+        responses = []
+        def post(n):
+            responses.append(self.client.post('/transactions', json={
+                "trans_type": "expense", "amount": n, "category": "Groceries", "date": "2024-07-01"
+            }))
+        threads = [threading.Thread(target=post, args=(n,)) for n in range(1, 21)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({r.status_code for r in responses}, {201})
+        stored = {t['id']: t['amount'] for t in self.client.get('/transactions').json}
+        self.assertEqual(stored, {r.json['id']: r.json['amount'] for r in responses})
+
+    def test_full_queue_returns_503(self):
+        app.config['WRITE_BEHIND_QUEUE_SIZE'] = 1
+        category_id = self.client.post('/categories', json={"name": "Groceries"}).json['id']
+        values = {'trans_type': 'expense', 'amount_cents': 100, 'category_id': category_id, 'date': date(2024, 7, 1)}
+        # Hold the write lock so the writer thread stalls on its first batch.
+        blocker = sqlite3.connect(os.path.join(DB_DIR, 'test_budget.db'), isolation_level=None)
+        blocker.execute('BEGIN IMMEDIATE')
+        futures = []
+        with self.assertRaises(queue.Full):
+            for _ in range(3):
+                futures.append(self.queue.submit(values))
+        response = self.client.post('/transactions', json={
+            "trans_type": "expense", "amount": 1, "category": "Groceries", "date": "2024-07-01"
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        blocker.rollback()
+        blocker.close()
+        self.assertEqual([future.result(timeout=10) for future in futures], list(range(1, len(futures) + 1)))
+
+    def test_timeout_returns_503_and_drops_the_row(self):
+        app.config['WRITE_BEHIND_TIMEOUT'] = 0.2
+        self.addCleanup(app.config.update, WRITE_BEHIND_TIMEOUT=5)
+        category_id = self.client.post('/categories', json={"name": "Groceries"}).json['id']
+        values = {'trans_type': 'expense', 'amount_cents': 100, 'category_id': category_id, 'date': date(2024, 7, 1)}
+        blocker = sqlite3.connect(os.path.join(DB_DIR, 'test_budget.db'), isolation_level=None)
+        blocker.execute('BEGIN IMMEDIATE')
+        # The writer takes this row and stalls on the lock, so the POST waits in the queue.
+        stalled = self.queue.submit(values)
+        time.sleep(0.1)
+        response = self.client.post('/transactions', json={
+            "trans_type": "expense", "amount": 2, "category": "Groceries", "date": "2024-07-01"
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        blocker.rollback()
+        blocker.close()
+        self.assertEqual(stalled.result(timeout=10), 1)
+        self.assertEqual(self.add("expense", 3, "Groceries", "2024-07-01")['id'], 2)
+        self.assertEqual([t['amount'] for t in self.client.get('/transactions').json], [1, 3])
+
+    def test_failed_batch_keeps_the_writer_running(self):
+        values = {'trans_type': 'expense', 'amount_cents': 100, 'category_id': 99, 'date': date(2024, 7, 1)}
+        with self.assertRaises(IntegrityError):
+            self.queue.submit(values).result(timeout=10)
+        self.assertEqual(self.add("expense", 1, "Groceries", "2024-07-01")['id'], 1)
+
+
+class TestReports(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.add("income", 1000, "Salary", "2024-07-01")
+        self.add("income", 250, "Freelance", "2024-07-02")
+        self.add("expense", 200, "Groceries", "2024-07-03")
+        self.add("expense", 50, "Groceries", "2024-07-04")
+        self.add("expense", 75, "Fuel", "2024-07-05")
+
+    def test_status(self):
+        self.assertEqual(self.client.get('/status').json, {
+            "total_income": 1250,
+            "total_expense": 325,
+            "balance": 925
+        })
+
+    def test_totals_follow_writes(self):
+        self.client.delete('/transactions/3')
+        self.client.post('/transactions/batch', json=[
+            {"trans_type": "expense", "amount": 0.5, "category": "Fuel", "date": "2024-07-06"},
+        ])
+        with app.app_context(), db.engine.begin() as connection:
+            connection.exec_driver_sql('''UPDATE "transaction" SET trans_type = 'income' WHERE id = 5''')
+        self.assertEqual(self.client.get('/status').json, {
+            "total_income": 1325,
+            "total_expense": 50.5,
+            "balance": 1274.5
+        })
+        with app.app_context():
+            self.assertEqual(rebuild_totals(), {'income_cents': 0, 'expense_cents': 0})
+
+    def test_reports_over_partial_months(self):
+        self.add("expense", 10, "Groceries", "2024-06-30")
+        self.add("expense", 20, "Groceries", "2024-08-01")
+        self.add("expense", 40, "Fuel", "2024-08-31")
+        self.add("expense", 80, "Fuel", "2024-09-15")
+        self.client.delete('/transactions/5')
+        with app.app_context(), db.engine.begin() as connection:
+            connection.exec_driver_sql('''UPDATE "transaction" SET date = '2024-09-01' WHERE id = 9''')
+        cases = {
+            (None, None): {"Groceries": 280, "Fuel": 120},
+            ("2024-07-01", "2024-07-31"): {"Groceries": 250},
+            ("2024-07-04", "2024-08-01"): {"Groceries": 70},
+            ("2024-06-30", "2024-08-31"): {"Groceries": 280, "Fuel": 40},
+            ("2024-08-02", None): {"Fuel": 120},
+            (None, "2024-07-03"): {"Groceries": 210},
+            ("2024-07-02", "2024-07-03"): {"Groceries": 200},
+        }
+        for (start, end), expected in cases.items():
+            query = {key: value for key, value in (('from', start), ('to', end)) if value}
+            self.assertEqual(self.client.get('/reports/category', query_string=query).json, expected, query)
+        status = self.client.get('/status?from=2024-07-02&to=2024-08-31').json
+        self.assertEqual(status, {"total_income": 250, "total_expense": 310, "balance": -60})
+
+        # No month follows December 9999, so ranges reaching it stay open.
+        self.add("expense", 5, "Fuel", "9999-12-20")
+        boundaries = {
+            ("0001-01-01", "9999-12-31"): {"Groceries": 280, "Fuel": 125},
+            ("9999-12-15", None): {"Fuel": 5},
+            ("9999-12-15", "9999-12-31"): {"Fuel": 5},
+            ("2024-08-02", "9999-12-31"): {"Fuel": 125},
+        }
+        for (start, end), expected in boundaries.items():
+            query = {key: value for key, value in (('from', start), ('to', end)) if value}
+            self.assertEqual(self.client.get('/reports/category', query_string=query).json, expected, query)
+        self.assertEqual(self.client.get('/status?to=9999-12-31').json['total_expense'], 405)
+        self.assertEqual(self.client.get('/status?from=9999-12-15').json['total_expense'], 5)
+        self.assertEqual(self.client.get('/transactions/count?to=9999-12-31').json, {"count": 9})
+
+    def test_rebuild_reports_drift(self):
+        with app.app_context():
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql('UPDATE totals SET income_cents = 0 WHERE id = 1')
+            self.assertEqual(rebuild_totals(), {'income_cents': -125000, 'expense_cents': 0})
+        self.assertEqual(self.client.get('/status').json['total_income'], 1250)
+
+    def test_category_report(self):
+        self.assertEqual(self.client.get('/reports/category').json, {"Groceries": 250, "Fuel": 75})
+        self.assertEqual(self.client.get('/reports/category?trans_type=income').json, {"Salary": 1000, "Freelance": 250})
+        self.assertEqual(self.client.get('/reports/category?trans_type=gift').status_code, 400)
+
+
+class TestReportCache(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.add("expense", 200, "Groceries", "2024-07-03")
+        self.addCleanup(report_cache.clear)
+        self.addCleanup(app.config.update, REPORT_CACHE_SIZE=1024, REPORT_CACHE_PATH=None)
+
+    def stats(self):
+        return self.client.get('/reports/cache').json
+
+    def test_hits_until_write(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get('/reports/category').json, {"Groceries": 200})
+        self.assertEqual((self.stats()['hits'], self.stats()['misses']), (2, 1))
+        self.add("expense", 50, "Groceries", "2024-07-04")
+        self.assertEqual(self.client.get('/reports/category').json, {"Groceries": 250})
+        self.assertEqual(self.stats()['misses'], 2)
+
+    def test_parameters_normalized(self):
+        self.client.get('/reports/category')
+        self.client.get('/reports/category?trans_type=expense')
+        self.client.get('/status?to=2024-07-31&from=2024-07-01')
+        self.client.get('/status?from=2024-07-01&to=2024-07-31')
+        self.assertEqual((self.stats()['hits'], self.stats()['misses']), (2, 2))
+
+    def test_eviction(self):
+        app.config['REPORT_CACHE_SIZE'] = 2
+        report_cache.clear()
+        for trans_type in ('expense', 'income', 'expense'):
+            self.client.get('/reports/category', query_string={'trans_type': trans_type})
+        self.client.get('/status')
+        stats = self.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['entries']), (1, 3, 1, 2))
+
+    def test_shared_backend(self):
+        app.config['REPORT_CACHE_PATH'] = os.path.join(DB_DIR, 'report_cache.db')
+        report_cache.clear()
+        self.client.get('/reports/category')
+        # A fresh cache over the same file sees the entry another process stored.
+        report_cache._store = None
+        self.client.get('/reports/category')
+        stats = self.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['shared']), (1, 1, True))
+
+
+class TestCategories(APITestCase):
+    def test_registered_on_insert(self):
+        self.add("expense", 10, "Groceries", "2024-07-01")
+        self.add("expense", 10, "Groceries", "2024-07-02")
+        self.client.post('/transactions/batch', json=[
+            {"trans_type": "expense", "amount": 5, "category": "Fuel", "date": "2024-07-03"},
+            {"trans_type": "expense", "amount": 5, "category": "Groceries", "date": "2024-07-03"},
+        ])
+        names = [c['name'] for c in self.client.get('/categories').json]
+        self.assertEqual(names, ["Fuel", "Groceries"])
+        self.assertEqual(self.client.get('/reports/category').json, {"Fuel": 5, "Groceries": 25})
+
+    def test_create_and_delete(self):
+        response = self.client.post('/categories', json={"name": "Rent"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.post('/categories', json={"name": "Rent"}).status_code, 200)
+        self.assertEqual(self.client.post('/categories', json={}).status_code, 400)
+        self.assertEqual(self.client.delete(f"/categories/{response.json['id']}").status_code, 204)
+        self.assertEqual(self.client.get('/categories').json, [])
+
+    def test_cannot_delete_used_category(self):
+        self.add("expense", 10, "Groceries", "2024-07-01")
+        category = self.client.get('/categories').json[0]
+        self.assertEqual(self.client.delete(f"/categories/{category['id']}").status_code, 409)
+
+    def test_delete_racing_an_insert(self):
+        self.add("expense", 10, "Groceries", "2024-07-01")
+        category = self.client.get('/categories').json[0]
+        # As if the transaction landed after the in-use check.
+        with mock.patch.object(db.session, 'scalar', return_value=None):
+            response = self.client.delete(f"/categories/{category['id']}")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get('/transactions').json[0]['category'], "Groceries")
+
+    def test_writes_survive_a_stale_cache(self):
+        writes = [
+            lambda name: self.client.post('/transactions', json={"trans_type": "expense", "amount": 1, "category": name, "date": "2024-07-01"}),
+            lambda name: self.client.post('/transactions/batch', json=[{"trans_type": "expense", "amount": 1, "category": name, "date": "2024-07-01"}]),
+            lambda name: self.client.post('/batch', json=[{"op": "update", "id": 1, "set": {"category": name}}]),
+            lambda name: self.client.patch('/transactions?category=Nowhere', json={"set": {"category": name}}),
+        ]
+        for index, write in enumerate(writes):
+            name = f"Stale {index}"
+            self.client.post('/categories', json={"name": name})
+            # Another worker deletes the category; this one's cache still has it.
+            with app.app_context(), db.engine.begin() as connection:
+                connection.exec_driver_sql('DELETE FROM categories WHERE name = ?', (name,))
+            self.assertLess(write(name).status_code, 300, name)
+        self.assertEqual(self.client.get('/transactions').status_code, 200)
+        with app.app_context():
+            self.assertEqual(db.session.execute(db.text('PRAGMA foreign_key_check')).all(), [])
+
+    def test_orphaned_rows_still_list(self):
+        self.add("expense", 10, "Groceries", "2024-07-01")
+        with app.app_context(), db.engine.connect() as connection:
+            connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+            connection.exec_driver_sql(
+                "INSERT INTO \"transaction\" (trans_type, amount_cents, category_id, date) VALUES ('expense', 100, 99, '2024-07-02')")
+            connection.commit()
+            connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+        response = self.client.get('/transactions?sort=id')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([t['category'] for t in response.json], ["Groceries", None])
+
+
+class TestConditionalGet(APITestCase):
+    def test_not_modified_until_write(self):
+        self.add("expense", 10, "Groceries", "2024-07-01")
+        for path in ('/transactions', '/status', '/reports/category'):
+            first = self.client.get(path)
+            etag = first.headers['ETag']
+            again = self.client.get(path, headers={'If-None-Match': etag})
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(again.headers['ETag'], etag)
+
+        etag = self.client.get('/transactions').headers['ETag']
+        created = self.add("expense", 20, "Groceries", "2024-07-02")
+        changed = self.client.get('/transactions', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+
+        etag = changed.headers['ETag']
+        self.client.delete(f"/transactions/{created['id']}")
+        self.assertEqual(self.client.get('/transactions', headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_export_follows_categories(self):
+        self.add("expense", 10, "Groceries", "2024-07-01")
+        etag = self.client.get('/export?format=bin').headers['ETag']
+        self.assertEqual(self.client.get('/export?format=bin', headers={'If-None-Match': etag}).status_code, 304)
+        unused = self.client.post('/categories', json={"name": "Travel"}).json['id']
+        added = self.client.get('/export?format=bin', headers={'If-None-Match': etag})
+        self.assertEqual(added.status_code, 200)
+        self.assertEqual(ledger_format.Ledger(added.data).categories, ["Groceries", "Travel"])
+        # SQLite reuses the highest rowid once it is deleted.
+        self.client.delete(f'/categories/{unused}')
+        self.assertEqual(self.client.post('/categories', json={"name": "Fuel"}).json['id'], unused)
+        self.assertEqual(self.client.get('/export?format=bin', headers={'If-None-Match': added.headers['ETag']}).status_code, 200)
+
+    def test_batch_changes_etag(self):
+        etag = self.client.get('/status').headers['ETag']
+        self.client.post('/transactions/batch', json=[
+            {"trans_type": "income", "amount": 10, "category": "Salary", "date": "2024-07-01"}
+        ])
+        self.assertEqual(self.client.get('/status', headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_representations_have_distinct_etags(self):
+        json_etag = self.client.get('/transactions').headers['ETag']
+        ndjson_etag = self.client.get('/transactions?format=ndjson').headers['ETag']
+        self.assertNotEqual(json_etag, ndjson_etag)
+
+
+class TestChangeFeed(APITestCase):
+    def test_changes_since_version(self):
+        first = self.add("expense", 10, "Groceries", "2024-07-01")
+        version = self.client.get('/transactions/changes').json['version']
+        self.assertEqual(self.client.get(f'/transactions/changes?since={version}').json['upserts'], [])
+
+        second = self.add("expense", 20, "Fuel", "2024-07-02")
+        self.client.delete(f"/transactions/{first['id']}")
+        delta = self.client.get(f'/transactions/changes?since={version}').json
+        self.assertEqual(delta['upserts'], [second])
+        self.assertEqual(delta['deletes'], [first['id']])
+        self.assertFalse(delta['more'])
+        self.assertGreater(delta['version'], version)
+
+    def test_sync_from_zero_in_pages(self):
+        created = [self.add("expense", i, "Groceries", "2024-07-01") for i in range(1, 6)]
+        self.client.delete(f"/transactions/{created[0]['id']}")
+        mirror, since = {}, 0
+        while True:
+            delta = self.client.get(f'/transactions/changes?since={since}&limit=2').json
+            mirror.update((t['id'], t) for t in delta['upserts'])
+            for transaction_id in delta['deletes']:
+                mirror.pop(transaction_id, None)
+            since = delta['version']
+            if not delta['more']:
+                break
+        self.assertEqual(sorted(mirror.values(), key=lambda t: t['id']), created[1:])
+
+    def test_compaction(self):
+        from app import compact_changes
+        created = [self.add("expense", 10, "Groceries", "2024-07-01") for _ in range(3)]
+        for transaction in created[:2]:
+            self.client.delete(f"/transactions/{transaction['id']}")
+        app.config['CHANGE_LOG_RETENTION'] = 0
+        try:
+            with app.app_context():
+                self.assertEqual(compact_changes(), 2)
+        finally:
+            app.config['CHANGE_LOG_RETENTION'] = 1000000
+        self.assertEqual(self.client.get('/transactions/changes?since=0').status_code, 410)
+        version = self.client.get('/transactions/changes').json['version']
+        self.assertEqual(self.client.get(f'/transactions/changes?since={version}').status_code, 200)
+
+    def test_since_out_of_range(self):
+        self.add("expense", 10, "Groceries", "2024-07-01")
+        version = self.client.get('/transactions/changes').json['version']
+        response = self.client.get('/transactions/changes?since=-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.json['error'])
+        # A version this database never issued, e.g. from before a restore.
+        self.assertEqual(self.client.get(f'/transactions/changes?since={version + 1}').status_code, 410)
+        self.assertEqual(self.client.get('/transactions/changes?since=abc').status_code, 400)
+
+
+class TestStorageProfile(APITestCase):
+    def test_pragmas_applied(self):
+        with app.app_context(), db.engine.connect() as connection:
+            pragmas = {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+                       for name in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store')}
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000, 'temp_store': 2})
+
+    def test_checkpoint(self):
+        self.add("expense", 10, "Groceries", "2024-07-01")
+        with app.app_context():
+            busy = checkpoint_wal()[0]
+        self.assertEqual(busy, 0)
+        self.assertEqual(os.path.getsize(os.path.join(DB_DIR, 'test_budget.db-wal')), 0)
+
+
+class TestMigrations(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_legacy_ledger('''
+            ('income', 977.0, 'Salary', '2024-07-12'),
+            ('expense', 0.1, 'Coffee', '2024-07-13'),
+            ('Expense ', 0.2, 'Coffee', '07/14/2024')
+        ''')
+        with app.app_context():
+            init_db()
+
+    def create_legacy_ledger(self, rows):
+        # Recreate the schema as the very first version of the app left it.
+        with app.app_context():
+            db.drop_all()
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql('''
+                    CREATE TABLE "transaction" (
+                        id INTEGER NOT NULL,
+                        trans_type VARCHAR(50),
+                        amount FLOAT,
+                        category VARCHAR(50),
+                        date VARCHAR(50),
+                        PRIMARY KEY (id)
+                    )
+                ''')
+                connection.exec_driver_sql('INSERT INTO "transaction" (trans_type, amount, category, date) VALUES ' + rows)
+                connection.exec_driver_sql('PRAGMA user_version = 0')
+
+    def test_indexes_added(self):
+        with app.app_context(), db.engine.connect() as connection:
+            indexes = {row[0] for row in connection.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'transaction'")}
+            analyzed = connection.exec_driver_sql("SELECT count(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").scalar()
+        self.assertTrue({'ix_transaction_date_id_amount', 'ix_transaction_type_category_amount', 'ix_transaction_category_date'} <= indexes)
+        self.assertEqual(analyzed, 1)
+
+    def test_amounts_converted_to_cents(self):
+        with app.app_context(), db.engine.connect() as connection:
+            stored = connection.exec_driver_sql('SELECT amount_cents, typeof(amount_cents) FROM "transaction" ORDER BY id').all()
+        self.assertEqual(stored, [(97700, 'integer'), (10, 'integer'), (20, 'integer')])
+        self.assertEqual(self.client.get('/reports/category').json, {"Coffee": 0.3})
+
+    def test_dates_normalized(self):
+        dates = [t['date'] for t in self.client.get('/transactions').json]
+        self.assertEqual(dates, ['2024-07-12', '2024-07-13', '2024-07-14'])
+
+    def test_change_log_seeded(self):
+        delta = self.client.get('/transactions/changes?since=0').json
+        self.assertEqual(len(delta['upserts']), 3)
+
+    def test_rollup_seeded(self):
+        with app.app_context(), db.engine.connect() as connection:
+            rollup = connection.exec_driver_sql(
+                'SELECT month, trans_type, total_cents, count FROM monthly_rollup ORDER BY 1, 2').all()
+        self.assertEqual(rollup, [('2024-07-01', 'expense', 30, 2), ('2024-07-01', 'income', 97700, 1)])
+
+    def test_totals_seeded(self):
+        self.assertEqual(self.client.get('/status').json['total_expense'], 0.3)
+
+    def test_trans_types_normalized(self):
+        types = [t['trans_type'] for t in self.client.get('/transactions').json]
+        self.assertEqual(types, ['income', 'expense', 'expense'])
+        with app.app_context(), db.engine.connect() as connection:
+            with self.assertRaises(IntegrityError):
+                connection.exec_driver_sql('''UPDATE "transaction" SET trans_type = 'Income' WHERE id = 1''')
+
+    def test_unknown_trans_type_blocks_upgrade(self):
+        self.create_legacy_ledger("('expense', 5.0, 'Coffee', '2024-07-13'), ('gift', 20.0, 'Misc', '2024-07-14')")
+        with app.app_context():
+            with self.assertRaisesRegex(RuntimeError, 'Transactions 2 '):
+                init_db()
+            with db.engine.connect() as connection:
+                self.assertEqual(connection.exec_driver_sql('PRAGMA user_version').scalar(), 0)
+                self.assertEqual(connection.exec_driver_sql('SELECT trans_type FROM "transaction" WHERE id = 2').scalar(), 'gift')
+
+    def test_missing_amount_blocks_upgrade(self):
+        self.create_legacy_ledger("('expense', 5.0, 'Coffee', '2024-07-13'), ('expense', NULL, 'Coffee', '2024-07-14')")
+        with app.app_context():
+            with self.assertRaisesRegex(RuntimeError, 'Transactions 2 have no amount'):
+                init_db()
+            with db.engine.connect() as connection:
+                self.assertEqual(connection.exec_driver_sql('PRAGMA user_version').scalar(), 0)
+
+    def test_categories_extracted(self):
+        self.assertEqual([c['name'] for c in self.client.get('/categories').json], ['Coffee', 'Salary'])
+        categories = [t['category'] for t in self.client.get('/transactions').json]
+        self.assertEqual(categories, ['Salary', 'Coffee', 'Coffee'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
+import os
+import tempfile
 import unittest
-from budget_app_gui import Budget, Transaction
+from budget_app import Budget, Transaction
+from money import to_cents
 
 class TestTransaction(unittest.TestCase):
     def test_transaction_creation(self):
@@ -13,7 +16,7 @@ class TestTransaction(unittest.TestCase):
         transaction = Transaction("expense", 50, "Groceries", "2024-07-24")
         self.assertEqual(transaction.to_dict(), {
             "trans_type": "expense",
-            "amount": 50,
+            "amount_cents": 50,
             "category": "Groceries",
             "date": "2024-07-24"
         })
@@ -21,7 +24,7 @@ class TestTransaction(unittest.TestCase):
     def test_transaction_from_dict(self):
         data = {
             "trans_type": "income",
-            "amount": 200,
+            "amount_cents": 200,
             "category": "Freelance",
             "date": "2024-07-24"
         }
@@ -31,6 +34,20 @@ class TestTransaction(unittest.TestCase):
         self.assertEqual(transaction.category, "Freelance")
         self.assertEqual(transaction.date, "2024-07-24")
 
+    def test_transaction_from_legacy_dict(self):
+        data = {
+            "trans_type": "expense",
+            "amount": 12.34,
+            "category": "Groceries",
+            "date": "2024-07-24"
+        }
+        self.assertEqual(Transaction.from_dict(data).amount, 1234)
+
+    def test_transaction_from_legacy_float_noise(self):
+        for amount, cents in ((0.30000000000000004, 30), (1.005, 101), (12, 1200)):
+            data = {"trans_type": "expense", "amount": amount, "category": "Groceries", "date": "2024-07-24"}
+            self.assertEqual(Transaction.from_dict(data).amount, cents)
+
 class TestBudget(unittest.TestCase):
     def setUp(self):
         self.budget = Budget()
@@ -47,6 +64,16 @@ class TestBudget(unittest.TestCase):
         self.assertEqual(self.budget.transactions[0].trans_type, "expense")
         self.assertEqual(self.budget.transactions[0].amount, 100)
 
+    def test_amounts_must_be_cents(self):
+        for amount in (12.5, "1250", True, None, 10 ** 13 + 1):
+            with self.assertRaises(ValueError):
+                self.budget.add_income(amount, "Salary", "2024-07-24")
+            with self.assertRaises(ValueError):
+                self.budget.add_transaction("expense", amount, "Groceries", "2024-07-24")
+        self.assertEqual(self.budget.transactions, [])
+        self.budget.add_income(to_cents("12.50"), "Salary", "2024-07-24")
+        self.assertEqual(self.budget.transactions[0].amount, 1250)
+
     def test_view_status(self):
         self.budget.add_income(1000, "Salary", "2024-07-24")
         self.budget.add_expense(200, "Groceries", "2024-07-24")
@@ -55,6 +82,75 @@ class TestBudget(unittest.TestCase):
         self.assertEqual(total_expense, 200)
         self.assertEqual(balance, 800)
 
+    def test_totals_follow_writes(self):
+        self.budget.add_income(1000, "Salary", "2024-07-24")
+        trans_id = self.budget.add_expense(200, "Groceries", "2024-07-24")
+        self.budget.delete_transaction(trans_id)
+        self.assertEqual(self.budget.view_status(), (1000, 0, 1000))
+        self.budget.conn.execute('UPDATE totals SET expense_cents = 50')
+        self.assertEqual(self.budget.rebuild_totals(), (0, 50))
+        self.assertEqual(self.budget.view_status(), (1000, 0, 1000))
+
+    def test_amounts_stored_as_integer_cents(self):
+        self.budget.add_expense(10, "Coffee", "2024-07-24")
+        self.budget.add_expense(20, "Coffee", "2024-07-24")
+        self.assertEqual(self.budget.category_report(), {"Coffee": 30})
+        stored = self.budget.conn.execute('SELECT typeof(amount_cents) FROM transactions').fetchall()
+        self.assertEqual(stored, [("integer",), ("integer",)])
+
+    def test_category_report_from_rollup(self):
+        self.budget.add_expense(100, "Groceries", "2024-07-24")
+        self.budget.add_expense(50, "Groceries", "2024-08-01")
+        trans_id = self.budget.add_expense(70, "Fuel", "2024-08-02")
+        self.budget.add_income(1000, "Salary", "2024-08-02")
+        self.budget.delete_transaction(trans_id)
+        self.assertEqual(self.budget.category_report(), {"Groceries": 150})
+        rollup = self.budget.conn.execute('SELECT * FROM monthly_rollup ORDER BY month, category').fetchall()
+        self.assertEqual(rollup, [
+            ("2024-07", "Groceries", "expense", 100, 1),
+            ("2024-08", "Groceries", "expense", 50, 1),
+            ("2024-08", "Salary", "income", 1000, 1),
+        ])
+
+    def test_categories(self):
+        self.budget.add_expense(100, "Groceries", "2024-07-24")
+        self.budget.add_category("Rent")
+        self.budget.add_category("Rent")
+        self.assertEqual(self.budget.categories, ["Groceries", "Rent"])
+        self.budget.remove_category("Rent")
+        self.assertEqual(self.budget.categories, ["Groceries"])
+
+    def test_invalid_date_rejected(self):
+        with self.assertRaises(ValueError):
+            self.budget.add_income(1000, "Salary", "24/07/2024")
+
+    def test_get_transactions_date_range(self):
+        for date in ("2024-06-30", "2024-07-01", "2024-07-31", "2024-08-01"):
+            self.budget.add_expense(100, "Groceries", date)
+        july = self.budget.get_transactions("2024-07-01", "2024-07-31")
+        self.assertEqual([row[4] for row in july], ["2024-07-01", "2024-07-31"])
+
+    def test_migrate_real_amounts(self):
+        conn = self.budget.conn
+        conn.execute('DROP TABLE transactions')
+        conn.execute('CREATE TABLE transactions (id INTEGER PRIMARY KEY, trans_type TEXT, amount REAL, category TEXT, date TEXT)')
+        conn.execute("INSERT INTO transactions (trans_type, amount, category, date) VALUES ('expense', 0.1, 'Coffee', '2024-07-24')")
+        conn.commit()
+        self.budget.create_tables()
+        self.assertEqual(self.budget.transactions[0].amount, 10)
+        self.assertEqual(self.budget.view_status(), (0, 10, -10))
+
+    def test_storage_profile(self):
+        path = os.path.join(tempfile.mkdtemp(), "budget.db")
+        budget = Budget(path)
+        budget.add_income(1000, "Salary", "2024-07-24")
+        self.assertEqual(budget.conn.execute('PRAGMA journal_mode').fetchone(), ("wal",))
+        self.assertEqual(budget.checkpoint()[0], 0)
+        budget.conn.close()
+        budget = Budget(path, pragmas={"journal_mode": "delete"})
+        self.assertEqual(budget.conn.execute('PRAGMA journal_mode').fetchone(), ("delete",))
+        self.assertEqual(budget.view_status(), (1000, 0, 1000))
+
     def test_save_and_load(self):
         self.budget.add_income(1000, "Salary", "2024-07-24")
         self.budget.add_expense(200, "Groceries", "2024-07-24")